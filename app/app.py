@@ -3,22 +3,29 @@ import dash_core_components as dcc
 import dash_html_components as html
 import yaml
 import dash_bootstrap_components as dbc
-import json
 import redis
 import urllib.parse
 from flask_session import Session
 from flask import Flask, session
 from datetime import datetime, timedelta
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 
 import helpers.api.strava as api_strava
 import helpers.api.fitbit as api_fitbit
+import helpers.api.fetch as api_fetch
+import helpers.sync.strava_activities as sync_strava
+import helpers.sync.training_load as sync_training_load
+import helpers.sync.zones as sync_zones
 import helpers.ui.heartrate as ui_heartrate
 import helpers.ui.body_composition as ui_body_composition
 import helpers.ui.power as ui_power
 import helpers.ui.sleep as ui_sleep
 import helpers.ui.strava_activities as ui_strava
 import helpers.ui.fitbit_devices as ui_devices
+import helpers.ui.training_load as ui_training_load
+import helpers.ui.zones as ui_zones
+import helpers.ui.charts as ui_charts
 import helpers.common as common
 import helpers.auth.strava_auth as auth_strava
 import helpers.auth.fitbit_auth as auth_fitbit
@@ -134,6 +141,8 @@ def logout():
     session.pop(SESSION_STRAVA_REFRESH_TOKEN_KEY, None)
     session.pop(SESSION_STRAVA_EXPIRES_KEY, None)
     session.pop(SESSION_STRAVA_ACCESS_TOKEN_KEY, None)
+    session.pop(SESSION_STRAVA_ATHLETE_ID_KEY, None)
+    session.pop(SESSION_FITBIT_USER_ID_KEY, None)
 
 
 def get_fitbit_login_url():
@@ -272,21 +281,39 @@ def strava_auth(query):
     )
 
 
+def render_or_error(results, errors, name, render):
+    # Render the result of a concurrent fetch, or a warning in its place if that call failed
+    if name in errors:
+        return dbc.Alert(f'Unable to load {name.replace("_", " ")}: {errors[name]}', color='warning')
+    return render(results[name])
+
+
+# How many of the newest activities the dashboard lists (the same as a page of Strava's activity list)
+DASHBOARD_ACTIVITY_COUNT = 30
+
+# The ranges the dashboard's resting heart rate and sleep history can show. The older part of long ones is backfilled
+# from Fitbit in the background the first time they're viewed, and shows once it's in
+HISTORY_RANGES = [('30 days', 30), ('90 days', 90), ('1 year', 365), ('2 years', 730), ('5 years', 1825)]
+DEFAULT_HISTORY_DAYS = 30
+
+
 def dashboard():
     if auth_fitbit.ensure_valid_access_token() and auth_strava.ensure_valid_access_token():
 
         # Get the access tokens (now we have checked to ensure they're valid)
         strava_access_token = session.get(SESSION_STRAVA_ACCESS_TOKEN_KEY, None)
         fitbit_access_token = session.get(SESSION_FITBIT_ACCESS_TOKEN_KEY, None)
-
-        # Get Fitbit data
-        heart_rate_history = api_fitbit.get_heart_rate_history(fitbit_access_token)
-        heart_rate_details = api_fitbit.get_heart_rate_detailed(fitbit_access_token)
-        sleep_history = api_fitbit.get_sleep_history(fitbit_access_token)
-        devices = api_fitbit.get_device_information(fitbit_access_token)
-
-        # Get Strava data
-        activity_history = api_strava.get_strava_activities(strava_access_token)
+        strava_athlete_id = auth_strava.get_athlete_id()
+
+        # Get the Fitbit and Strava data, none of these calls depend on each other so they are all made at once
+        results, errors = api_fetch.fetch_all({
+            'heart_rate_details': (api_fitbit.get_day_heart_rate, (fitbit_access_token,)),
+            'devices': (api_fitbit.get_device_information, (fitbit_access_token,)),
+            'activity_history': (lambda: sync_strava.get_activities(strava_access_token, strava_athlete_id, limit=DASHBOARD_ACTIVITY_COUNT), ()),
+            'best_power_curves': (api_strava.get_best_power_curves, (strava_athlete_id,)),
+            'training_load': (sync_training_load.get_training_load, (strava_access_token, strava_athlete_id)),
+            'weekly_zones': (sync_zones.get_weekly_zones, (strava_access_token, strava_athlete_id)),
+        })
 
         return dbc.Container(
             [
@@ -294,17 +321,32 @@ def dashboard():
                     [
                         dbc.Col(
                             [
-                                ui_devices.get_device_table(devices)
+                                render_or_error(results, errors, 'devices', ui_devices.get_device_table)
                             ]
                         )
                     ]
                 ),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            [
+                                dcc.Dropdown(
+                                    id='history-days',
+                                    options=[{'label': label, 'value': days} for label, days in HISTORY_RANGES],
+                                    value=DEFAULT_HISTORY_DAYS,
+                                    clearable=False
+                                )
+                            ],
+                            md=3
+                        )
+                    ]
+                ),
                 dbc.Row(
                     [
                         dbc.Col(
                             [
                                 html.H3("Resting heart rate"),
-                                ui_heartrate.get_resting_heart_rate_graph(heart_rate_history)
+                                html.Div(id='resting-hr-history')
                             ],
                             md=10,
                         ),
@@ -321,7 +363,7 @@ def dashboard():
                         dbc.Col(
                             [
                                 html.H3("Yesterday's heart rate"),
-                                ui_heartrate.get_detailed_heart_rate_graph(heart_rate_details)
+                                render_or_error(results, errors, 'heart_rate_details', ui_heartrate.get_detailed_heart_rate_graph)
                             ],
                             md=10
                         ),
@@ -338,7 +380,7 @@ def dashboard():
                         dbc.Col(
                             [
                                 html.H3("Sleep efficiency"),
-                                ui_sleep.get_sleep_efficiency_graph(sleep_history)
+                                html.Div(id='sleep-efficiency-history')
                             ],
                             md=10
                         ),
@@ -355,7 +397,24 @@ def dashboard():
                         dbc.Col(
                             [
                                 html.H3("Sleep history"),
-                                ui_sleep.get_sleep_history_graph(sleep_history)
+                                html.Div(id='sleep-record-history')
+                            ],
+                            md=10
+                        ),
+                        dbc.Col(
+                            [
+                                html.H3('Summary')
+                            ],
+                            md=2
+                        )
+                    ]
+                ),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            [
+                                html.H3("Sleep by night"),
+                                html.Div(id='sleep-nights-history')
                             ],
                             md=10
                         ),
@@ -372,7 +431,7 @@ def dashboard():
                         dbc.Col(
                             [
                                 html.H3("Activities"),
-                                ui_strava.get_activity_history_graph(activity_history)
+                                render_or_error(results, errors, 'activity_history', ui_strava.get_activity_history_graph)
                             ],
                             md=10
                         ),
@@ -389,7 +448,40 @@ def dashboard():
                         dbc.Col(
                             [
                                 html.H3("Cycling activities"),
-                                ui_strava.get_cycling_activity_history_table(activity_history)
+                                render_or_error(results, errors, 'activity_history', ui_strava.get_cycling_activity_history_table)
+                            ],
+                            md=12
+                        )
+                    ]
+                ),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            [
+                                html.H3("Best power"),
+                                render_or_error(results, errors, 'best_power_curves', ui_power.get_best_power_curves_graph)
+                            ],
+                            md=12
+                        )
+                    ]
+                ),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            [
+                                html.H3("Training load"),
+                                render_or_error(results, errors, 'training_load', ui_training_load.get_training_load_graph)
+                            ],
+                            md=12
+                        )
+                    ]
+                ),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            [
+                                html.H3("Weekly zones"),
+                                render_or_error(results, errors, 'weekly_zones', ui_zones.get_weekly_zones)
                             ],
                             md=12
                         )
@@ -407,6 +499,25 @@ def dashboard():
         ])
 
 
+def get_activity_start(activity):
+    return datetime.strptime(activity[STRAVA_API_KEY_ACTIVITY_START_LOCAL], UTC_DATE_FORMAT)
+
+
+def get_activity_heart_rate(fitbit_access_token, activity):
+    # The Fitbit heart rate from an hour before the activity to two hours after it (for the recovery)
+    start = get_activity_start(activity)
+    end = start + timedelta(seconds=activity[STRAVA_API_KEY_ELAPSED_TIME])
+    return api_fitbit.get_heart_rate_range(fitbit_access_token, start - timedelta(hours=1), end + timedelta(hours=2))
+
+
+def get_activity_heart_rate_offset(fitbit_access_token, activity_stream, day_heartrate, activity):
+    # The offset between the activity's and Fitbit's heart rate, kept once Fitbit has all of the activity's heart rate
+    start = get_activity_start(activity)
+    end = start + timedelta(seconds=activity[STRAVA_API_KEY_ELAPSED_TIME])
+    heart_rate_complete = api_fitbit.is_heart_rate_complete(fitbit_access_token, start, end)
+    return api_strava.get_heart_rate_offset(activity_stream, day_heartrate, start, heart_rate_complete)
+
+
 def cycling(query):
     activity_id = common.get_parameter(query, 'activity')[0]
     if auth_fitbit.ensure_valid_access_token() and auth_strava.ensure_valid_access_token():
@@ -415,19 +526,42 @@ def cycling(query):
         strava_access_token = session.get(SESSION_STRAVA_ACCESS_TOKEN_KEY, None)
         fitbit_access_token = session.get(SESSION_FITBIT_ACCESS_TOKEN_KEY, None)
 
-        cycling_activity = api_strava.get_strava_activity(strava_access_token, activity_id)
-        cycling_activity_stream = api_strava.get_strava_activity_stream(strava_access_token, activity_id)
-        power_averages = api_strava.get_cycling_activity_power_stats(cycling_activity_stream)
-        athlete = api_strava.get_strava_athlete(strava_access_token)
-        power_splits = api_strava.get_cycling_power_splits(cycling_activity_stream)
-        gradient_splits = api_strava.get_cycling_gradient_splits(cycling_activity_stream)
-
-        body_composition = api_fitbit.get_weight(fitbit_access_token, datetime.strptime(cycling_activity['start_date_local'], UTC_DATE_FORMAT))
-        day_heartrate = api_fitbit.get_heart_rate_detailed(fitbit_access_token, datetime.strptime(cycling_activity['start_date_local'], UTC_DATE_FORMAT), '1sec')
-        sleep = api_fitbit.get_sleep_history(fitbit_access_token, datetime.strptime(cycling_activity['start_date_local'], UTC_DATE_FORMAT) + timedelta(days=1), 1)
+        # Everything on the page can be fetched at once apart from the Fitbit data, which needs the activity's start
+        # date. Those calls are started as soon as the activity has been fetched.
+        results, errors = api_fetch.fetch_plan({
+            'activity': (api_strava.get_strava_activity, (strava_access_token, activity_id), ()),
+            'stream': (api_strava.get_activity_stream, (strava_access_token, activity_id), ()),
+            'athlete': (api_strava.get_strava_athlete, (strava_access_token,), ()),
+            'start_date': (get_activity_start, (), ('activity',)),
+            'weight_before': (api_fitbit.get_weight_log_before, (fitbit_access_token,), ('start_date',)),
+            'weight_after': (api_fitbit.get_weight_log_after, (fitbit_access_token,), ('start_date',)),
+            'day_heartrate': (get_activity_heart_rate, (fitbit_access_token,), ('activity',)),
+            'sleep': (lambda start: api_fitbit.get_sleep_history(fitbit_access_token, start + timedelta(days=1), 1), (), ('start_date',)),
+        })
+
+        # We can't show anything without the activity itself
+        for required in ['activity', 'stream', 'athlete']:
+            if required in errors:
+                return html.Div([
+                    html.H3('Strava'),
+                    html.P(f'Unable to load the {required}: {errors[required]}')
+                ])
+
+        cycling_activity = results['activity']
+        activity_stream = results['stream']
+        athlete = results['athlete']
+        power_curve = api_strava.get_cycling_power_curve(activity_stream, cycling_activity)
+        power_averages = api_strava.get_cycling_activity_power_stats(power_curve)
+        api_strava.get_cycling_power_state(activity_stream)
+        power_splits = api_strava.get_cycling_power_splits(activity_stream)
+        gradient_splits = api_strava.get_cycling_gradient_splits(activity_stream)
+
+        if 'weight_before' in errors or 'weight_after' in errors:
+            body_composition = {'type': 'insufficient-data', 'fat': None, 'weight': None}
+        else:
+            body_composition = api_fitbit.get_weight_from_logs(results['start_date'], results['weight_before'], results['weight_after'])
 
-        # Store the activity stream so we can access it in callbacks
-        session[f'{SESSION_STRAVA_ACTIVITY_STREAMS_KEY}-{activity_id}'] = json.dumps(cycling_activity_stream)
+        sleep_graphs = [render_or_error(results, errors, 'sleep', None)] if 'sleep' in errors else ui_sleep.get_detailed_sleep_graph(results['sleep'])
 
         return dbc.Container(
             [
@@ -469,7 +603,7 @@ def cycling(query):
                                     [
                                         dbc.Col(
                                             [
-                                                ui_strava.get_cycling_activity_graph(cycling_activity_stream)
+                                                ui_strava.get_cycling_activity_graph(activity_stream)
                                             ],
                                             md=12,
                                         )
@@ -538,6 +672,17 @@ def cycling(query):
                                         )
                                     ]
                                 ),
+                                dbc.Row(
+                                    [
+                                        dbc.Col(
+                                            [
+                                                html.H3("Power curve"),
+                                                ui_power.get_power_curve_graph(power_curve)
+                                            ],
+                                            md=12,
+                                        )
+                                    ]
+                                ),
                                 dbc.Row(
                                     [
                                         dbc.Col(
@@ -562,6 +707,21 @@ def cycling(query):
                                 ),
                             ]
                         ),
+                        dcc.Tab(
+                            label='Zones',
+                            children=[
+                                dbc.Row(
+                                    [
+                                        dbc.Col(
+                                            [
+                                                html.Div(id='zones')
+                                            ],
+                                            md=12,
+                                        )
+                                    ]
+                                ),
+                            ]
+                        ),
                         dcc.Tab(
                             label='Heartrate',
                             children=[
@@ -570,10 +730,7 @@ def cycling(query):
                                         dbc.Col(
                                             [
                                                 html.H3("Recovery heartrate"),
-                                                ui_heartrate.get_heartrate_recovery(cycling_activity_stream,
-                                                                                    day_heartrate, datetime.strptime(
-                                                        cycling_activity[STRAVA_API_KEY_ACTIVITY_START_LOCAL],
-                                                        UTC_DATE_FORMAT))
+                                                render_or_error(results, errors, 'day_heartrate', lambda day_heartrate: ui_heartrate.get_heartrate_recovery(activity_stream, day_heartrate, results['start_date'], get_activity_heart_rate_offset(fitbit_access_token, activity_stream, day_heartrate, results['activity'])))
                                             ],
                                             md=12,
                                         )
@@ -596,7 +753,7 @@ def cycling(query):
                                                 )
                                             ]
                                         ),
-                                        *ui_sleep.get_detailed_sleep_graph(sleep)
+                                        *sleep_graphs
                                     ]
                                 )
                             ]
@@ -619,12 +776,95 @@ def cycling(query):
 def number_render(ftp, query):
     activity_id = common.get_parameter(query, 'activity')[0]
 
-    # Get the activity stream that we serialised in the session
-    activity_stream = json.loads(session.get(f'{SESSION_STRAVA_ACTIVITY_STREAMS_KEY}-{activity_id}'))
-    power_summary = api_strava.get_cycling_power_summary(activity_stream, int(ftp))
+    # The input fires on every keystroke, so it may be empty part way through typing
+    if ftp is None or int(ftp) <= 0:
+        return html.P(EMPTY_PLACEHOLDER)
+
+    # The FTP independent values were worked out when the page loaded, only rebuild them if they've been dropped
+    power_state = api_strava.get_activity_power_state(session.get(SESSION_STRAVA_ACCESS_TOKEN_KEY, None), activity_id)
+
+    power_summary = api_strava.get_cycling_power_summary(power_state, int(ftp))
     return ui_power.get_cycling_power_summary_table(power_summary)
 
 
+@app.callback(
+    [
+        Output('resting-hr-history', 'children'),
+        Output('sleep-efficiency-history', 'children'),
+        Output('sleep-record-history', 'children'),
+        Output('sleep-nights-history', 'children')
+    ],
+    [Input('history-days', 'value')]
+)
+def history_render(days):
+    fitbit_access_token = session.get(SESSION_FITBIT_ACCESS_TOKEN_KEY, None)
+    end = datetime.now().date()
+    start = end - timedelta(days=days)
+
+    results, errors = api_fetch.fetch_all({
+        'heart_rate_history': (api_fitbit.get_heart_rate_days, (fitbit_access_token, start, end)),
+        'sleep_history': (api_fitbit.get_sleep_frame, (fitbit_access_token, start, end)),
+        'sleep_periods': (api_fitbit.get_sleep_periods, (fitbit_access_token, start, end)),
+    })
+    return [
+        render_or_error(results, errors, 'heart_rate_history', ui_heartrate.get_resting_heart_rate_graph),
+        render_or_error(results, errors, 'sleep_history', ui_sleep.get_sleep_efficiency_graph),
+        render_or_error(results, errors, 'sleep_history', ui_sleep.get_sleep_history_graph),
+        render_or_error(results, errors, 'sleep_periods', ui_sleep.get_sleep_nights_graph),
+    ]
+
+
+@app.callback(Output('zones', 'children'), [Input('ftp', "value")], [State('url', 'search')])
+def zones_render(ftp, query):
+    activity_id = common.get_parameter(query, 'activity')[0]
+    strava_access_token = session.get(SESSION_STRAVA_ACCESS_TOKEN_KEY, None)
+
+    # Heart rate zones don't need the FTP, so an FTP that's part way through being typed just leaves out the power zones
+    ftp = int(ftp) if ftp is not None and int(ftp) > 0 else None
+    cycling_activity = api_strava.get_strava_activity(strava_access_token, activity_id)
+    return ui_zones.get_cycling_zones(api_strava.get_cycling_zones(strava_access_token, cycling_activity, ftp))
+
+
+# The long time series graphs are sent downsampled. Zooming in redraws the visible part at full resolution (or as near
+# as the point budget allows) and resetting the zoom goes back to the downsampled whole
+@app.callback(Output('cycling-power-hr', 'figure'), [Input('cycling-power-hr', 'relayoutData')], [State('url', 'search')])
+def cycling_activity_zoom(relayout_data, query):
+    x_range = ui_charts.get_x_range(relayout_data)
+    if x_range is False:
+        raise PreventUpdate
+
+    activity_id = common.get_parameter(query, 'activity')[0]
+    activity_stream = api_strava.get_activity_stream(session.get(SESSION_STRAVA_ACCESS_TOKEN_KEY, None), activity_id)
+    return ui_strava.get_cycling_activity_figure(activity_stream, x_range)
+
+
+@app.callback(Output('recovery-hr', 'figure'), [Input('recovery-hr', 'relayoutData')], [State('url', 'search')])
+def heartrate_recovery_zoom(relayout_data, query):
+    x_range = ui_charts.get_x_range(relayout_data)
+    if x_range is False:
+        raise PreventUpdate
+
+    activity_id = common.get_parameter(query, 'activity')[0]
+    strava_access_token = session.get(SESSION_STRAVA_ACCESS_TOKEN_KEY, None)
+    cycling_activity = api_strava.get_strava_activity(strava_access_token, activity_id)
+    activity_start = get_activity_start(cycling_activity)
+    activity_stream = api_strava.get_activity_stream(strava_access_token, activity_id)
+    fitbit_access_token = session.get(SESSION_FITBIT_ACCESS_TOKEN_KEY, None)
+    day_heartrate = get_activity_heart_rate(fitbit_access_token, cycling_activity)
+    offset = get_activity_heart_rate_offset(fitbit_access_token, activity_stream, day_heartrate, cycling_activity)
+    return ui_heartrate.get_heartrate_recovery_figure(activity_stream, day_heartrate, activity_start, offset, x_range)
+
+
+@app.callback(Output('detailed-hr', 'figure'), [Input('detailed-hr', 'relayoutData')])
+def detailed_heart_rate_zoom(relayout_data):
+    x_range = ui_charts.get_x_range(relayout_data)
+    if x_range is False:
+        raise PreventUpdate
+
+    heart_rate_details = api_fitbit.get_day_heart_rate(session.get(SESSION_FITBIT_ACCESS_TOKEN_KEY, None))
+    return ui_heartrate.get_detailed_heart_rate_figure(heart_rate_details, x_range)
+
+
 @app.callback(dash.dependencies.Output('page-content', 'children'),
               [dash.dependencies.Input('url', 'pathname'), dash.dependencies.Input('url', 'search')])
 def display_page(pathname, search):
@@ -645,7 +885,8 @@ def display_page(pathname, search):
         return html.H1('404')
 
 
-if __name__ == '__main__':
+def run():
+    # Start the server (see server.py)
     host = '127.0.0.1'
     debug = True
     port = 5000
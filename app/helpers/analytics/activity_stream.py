@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+import helpers.analytics.resample as resample
+import helpers.common as common
+from helpers.constants import *
+
+DEFAULT_MEMO_SIZE = 16
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+class ActivityStream:
+    # The columns of an activity's stream, parsed once and shared by all the analytics and charts.
+    # Time is every second from the start of the activity, every other column is float32 with NaN where there's no data
+    # (including columns that weren't recorded at all, e.g. power on a ride without a power meter)
+    __slots__ = ('activity_id', 'time', 'power', 'heartrate', 'distance', 'altitude', 'grade')
+
+    def __init__(self, activity_id, time, power, heartrate, distance, altitude, grade):
+        self.activity_id = activity_id
+        self.time = time
+        self.power = power
+        self.heartrate = heartrate
+        self.distance = distance
+        self.altitude = altitude
+        self.grade = grade
+
+    def __len__(self):
+        return len(self.time)
+
+    def has_power(self):
+        return not np.all(np.isnan(self.power))
+
+    def has_heartrate(self):
+        return not np.all(np.isnan(self.heartrate))
+
+
+def from_columns(activity_id, columns: dict):
+    # Build an activity stream from a dictionary of Strava stream type to array (e.g. from the stream store).
+    # The columns are resampled to one sample per second so everything downstream can treat samples as seconds
+    time = np.asarray(columns[STRAVA_API_KEY_DATA_STREAM_TIME], dtype=np.int32)
+
+    def column(stream_type):
+        if stream_type in columns:
+            return np.asarray(columns[stream_type], dtype=np.float32)
+        return np.full(len(time), np.nan, dtype=np.float32)
+
+    resample_config = common.get_config_section('analytics').get('resample', None) or {}
+    time, resampled = resample.resample_to_1hz(
+        time,
+        {
+            STRAVA_API_KEY_DATA_STREAM_POWER: column(STRAVA_API_KEY_DATA_STREAM_POWER),
+            STRAVA_API_KEY_DATA_STREAM_HEARTRATE: column(STRAVA_API_KEY_DATA_STREAM_HEARTRATE),
+            STRAVA_API_KEY_DATA_STREAM_DISTANCE: column(STRAVA_API_KEY_DATA_STREAM_DISTANCE),
+            STRAVA_API_KEY_DATA_STREAM_ALTITUDE: column(STRAVA_API_KEY_DATA_STREAM_ALTITUDE),
+            STRAVA_API_KEY_DATA_STREAM_GRADE: column(STRAVA_API_KEY_DATA_STREAM_GRADE),
+        },
+        interpolated=[STRAVA_API_KEY_DATA_STREAM_DISTANCE, STRAVA_API_KEY_DATA_STREAM_ALTITUDE],
+        max_gap=resample_config.get('max_gap', resample.DEFAULT_MAX_GAP),
+        gap_fill=resample_config.get('gap_fill', resample.DEFAULT_GAP_FILL),
+        gap_filled=[STRAVA_API_KEY_DATA_STREAM_POWER],
+        max_coast=resample_config.get('max_coast', resample.DEFAULT_MAX_COAST)
+    )
+
+    return ActivityStream(
+        activity_id,
+        time,
+        resampled[STRAVA_API_KEY_DATA_STREAM_POWER],
+        resampled[STRAVA_API_KEY_DATA_STREAM_HEARTRATE],
+        resampled[STRAVA_API_KEY_DATA_STREAM_DISTANCE],
+        resampled[STRAVA_API_KEY_DATA_STREAM_ALTITUDE],
+        resampled[STRAVA_API_KEY_DATA_STREAM_GRADE],
+    )
+
+
+def memoized(activity_id, build):
+    # Get the activity stream for an activity from the memo, building it (with a function taking no arguments) if it
+    # isn't there. The least recently used streams are dropped once the memo is full
+    key = str(activity_id)
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+
+    activity_stream = build()
+
+    with _memo_lock:
+        _memo[key] = activity_stream
+        _memo.move_to_end(key)
+        while len(_memo) > common.get_config_section('analytics').get('stream_memo_size', DEFAULT_MEMO_SIZE):
+            _memo.popitem(last=False)
+    return activity_stream
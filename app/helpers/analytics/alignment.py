@@ -0,0 +1,85 @@
+import numpy as np
+
+# How far (seconds) the clocks of two recordings are searched for an offset either way
+DEFAULT_MAX_LAG = 10 * 60
+
+# The fewest seconds both recordings need data for at an offset for it to count
+DEFAULT_MIN_OVERLAP = 5 * 60
+
+# How well two recordings have to match (correlation) once shifted before the shift is trusted
+DEFAULT_MIN_CONFIDENCE = 0.5
+
+
+def get_lag(reference: np.ndarray, signal: np.ndarray, max_lag: int = DEFAULT_MAX_LAG, min_overlap: int = DEFAULT_MIN_OVERLAP):
+    # Estimate how many seconds the signal is behind the reference: the signal at second i lines up best with the
+    # reference at second i + lag. Both are sampled every second on the same clock with NaN where there's no data.
+    # The correlation of the two over the seconds they overlap is worked out for every lag at once from FFT cross
+    # correlations of the values, their squares and where there's data (so gaps don't count as zeros), instead of
+    # trying lags one by one.
+    # Returns the lag, the correlation at that lag (the confidence, 1 is a perfect match) and the number of seconds
+    # they overlap, or None if there isn't enough overlap at any lag
+    length = min(len(reference), len(signal))
+    reference = np.asarray(reference[:length], dtype=np.float64)
+    signal = np.asarray(signal[:length], dtype=np.float64)
+    reference_valid = ~np.isnan(reference)
+    signal_valid = ~np.isnan(signal)
+    if not reference_valid.any() or not signal_valid.any():
+        return None
+
+    # Centring first keeps the sums small so the correlation doesn't lose precision
+    reference = np.where(reference_valid, reference - reference[reference_valid].mean(), 0)
+    signal = np.where(signal_valid, signal - signal[signal_valid].mean(), 0)
+
+    # Padding to a power of two at least twice as long means lags either way don't wrap round into each other
+    size = 1 << int(2 * length - 1).bit_length()
+    max_lag = min(max_lag, length - 1)
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    def transform(values):
+        return np.fft.rfft(values, size)
+
+    def cross_correlate(a, b):
+        # The sum of a[i + lag] * b[i] over i for each lag
+        return np.fft.irfft(a * np.conj(b), size)[lags]
+
+    reference_mask, signal_mask = transform(reference_valid.astype(np.float64)), transform(signal_valid.astype(np.float64))
+    overlaps = np.rint(cross_correlate(reference_mask, signal_mask))
+    reference_sums = cross_correlate(transform(reference), signal_mask)
+    reference_squares = cross_correlate(transform(reference ** 2), signal_mask)
+    signal_sums = cross_correlate(reference_mask, transform(signal))
+    signal_squares = cross_correlate(reference_mask, transform(signal ** 2))
+    products = cross_correlate(transform(reference), transform(signal))
+
+    enough = overlaps >= max(min_overlap, 2)
+    if not enough.any():
+        return None
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        count = np.maximum(overlaps, 1)
+        covariance = products - reference_sums * signal_sums / count
+        variance = (reference_squares - reference_sums ** 2 / count) * (signal_squares - signal_sums ** 2 / count)
+        correlations = np.where(enough & (variance > 0), covariance / np.sqrt(np.maximum(variance, 0)), -np.inf)
+
+    best = int(np.argmax(correlations))
+    if not np.isfinite(correlations[best]):
+        return None
+    return {'lag': int(lags[best]), 'confidence': float(np.clip(correlations[best], -1, 1)), 'overlap': int(overlaps[best])}
+
+
+def get_offset(reference: np.ndarray, start: int, seconds: np.ndarray, values: np.ndarray, max_lag: int = DEFAULT_MAX_LAG, min_overlap: int = DEFAULT_MIN_OVERLAP):
+    # The lag (see get_lag) of a recording whose samples are at the given seconds from its start, against a reference
+    # sampled every second that covers it, where the recording starts at the given second of the reference. Only the
+    # part of the reference the recording covers (give or take the most it could be out by) is compared
+    if len(seconds) == 0:
+        return None
+
+    first = max(start - max_lag, 0)
+    last = min(start + int(seconds.max()) + 1 + max_lag, len(reference))
+    if last <= first:
+        return None
+
+    signal = np.full(last - first, np.nan)
+    positions = np.asarray(seconds, dtype=np.int64) + start - first
+    in_range = (positions >= 0) & (positions < len(signal))
+    signal[positions[in_range]] = values[in_range]
+    return get_lag(np.asarray(reference[first:last], dtype=np.float64), signal, max_lag, min_overlap)
@@ -0,0 +1,68 @@
+import numpy as np
+
+# Min/max keeps the lowest and highest sample in each bucket so spikes (e.g. sprints) survive, LTTB
+# (largest-triangle-three-buckets) keeps the sample that best preserves the shape of the line
+METHOD_MIN_MAX = 'minmax'
+METHOD_LTTB = 'lttb'
+
+
+def get_buckets(length: int, bucket_count: int):
+    # The boundaries of nearly equal buckets of samples
+    return np.linspace(0, length, bucket_count + 1).astype(np.int64)
+
+
+def min_max_indices(values: np.ndarray, max_points: int):
+    # The indices of the smallest and largest value in each bucket, in order. A bucket with no data keeps its first
+    # sample (NaN) so gaps in the line stay gaps
+    bucket_count = max(max_points // 2, 1)
+    boundaries = get_buckets(len(values), bucket_count)
+    starts = boundaries[:-1]
+
+    # Sort within each bucket in one go: NaN sorts last, so the first and last valid elements are the min and max
+    bucket_ids = np.repeat(np.arange(bucket_count), np.diff(boundaries))
+    order = np.lexsort((values, bucket_ids))
+    valid_counts = np.add.reduceat((~np.isnan(values)).astype(np.int64), starts)
+
+    has_data = valid_counts > 0
+    minimums = np.where(has_data, order[starts], starts)
+    maximums = np.where(has_data, order[starts + np.maximum(valid_counts - 1, 0)], starts)
+    return np.unique(np.concatenate([minimums, maximums]))
+
+
+def lttb_indices(values: np.ndarray, max_points: int):
+    # Largest-triangle-three-buckets: the first and last samples are kept, then from each bucket the sample making the
+    # largest triangle with the sample picked from the previous bucket and the mean of the next bucket
+    length = len(values)
+    boundaries = get_buckets(length - 2, max_points - 2) + 1
+    filled = np.where(np.isnan(values), np.nanmean(values) if not np.all(np.isnan(values)) else 0, values)
+
+    # The mean of every bucket is worked out up front so only the selection itself runs per bucket
+    positions = np.arange(length, dtype=np.float64)
+    sizes = np.maximum(np.diff(boundaries), 1)
+    mean_x = np.add.reduceat(positions[:-1], boundaries[:-1]) / sizes
+    mean_y = np.add.reduceat(filled[:-1], boundaries[:-1]) / sizes
+    mean_x = np.append(mean_x, length - 1)
+    mean_y = np.append(mean_y, filled[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = boundaries[bucket], boundaries[bucket + 1]
+        x = positions[start:end]
+        y = filled[start:end]
+        areas = np.abs((previous - mean_x[bucket + 1]) * (y - filled[previous]) - (previous - x) * (mean_y[bucket + 1] - filled[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def get_indices(values: np.ndarray, max_points: int, method: str = METHOD_MIN_MAX):
+    # The indices of the samples to plot so a line of evenly spaced samples has at most (about) the maximum points
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) <= max_points:
+        return np.arange(len(values))
+    if method == METHOD_LTTB and max_points > 2:
+        return lttb_indices(values, max_points)
+    return min_max_indices(values, max_points)
@@ -0,0 +1,59 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+DEFAULT_BUCKET_WIDTH = 1
+DEFAULT_SMOOTHING_WINDOW = 10
+
+
+def rolling_median(values: np.ndarray, window: int):
+    # The median of each trailing window (NaN until the first window is complete or if the window contains NaN)
+    smoothed = np.full(len(values), np.nan, dtype=np.float32)
+    if window <= 1:
+        smoothed[:] = values
+    elif len(values) >= window:
+        smoothed[window - 1:] = np.median(sliding_window_view(values, window), axis=1)
+    return smoothed
+
+
+def bucket_mean_max(bucket_ids: np.ndarray, values: np.ndarray, bucket_count: int):
+    # The NaN-aware mean and maximum of the values in each bucket, NaN for buckets with no data
+    valid = ~np.isnan(values)
+    totals = np.bincount(bucket_ids[valid], weights=values[valid], minlength=bucket_count)
+    counts = np.bincount(bucket_ids[valid], minlength=bucket_count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = totals / counts
+
+    maximums = np.full(bucket_count, np.nan)
+    np.fmax.at(maximums, bucket_ids[valid], values[valid])
+    return means, maximums
+
+
+def get_gradient_buckets(grade: np.ndarray, power: np.ndarray, heartrate: np.ndarray, bucket_width: float = DEFAULT_BUCKET_WIDTH, smoothing_window: int = DEFAULT_SMOOTHING_WINDOW):
+    # Group every second of a ride by its gradient (smoothed with a rolling median then rounded to the bucket width) and
+    # get the time spent, the mean and max power and the mean and max heart rate for each bucket.
+    # Every bucket between the lowest and highest gradient is included, even if no time was spent in it.
+    # Returns a dictionary of columns, one element per bucket
+    smoothed = rolling_median(np.asarray(grade, dtype=np.float32), smoothing_window)
+    graded = ~np.isnan(smoothed)
+    if not graded.any():
+        empty = np.array([], dtype=np.float64)
+        return {'gradient': empty, 'duration': empty.astype(np.int64), 'power_mean': empty, 'power_max': empty, 'hr_mean': empty, 'hr_max': empty}
+
+    # Integer bucket ids, starting from zero at the lowest gradient
+    bucket_ids = np.round(smoothed[graded] / bucket_width).astype(np.int64)
+    lowest = bucket_ids.min()
+    bucket_ids -= lowest
+    bucket_count = int(bucket_ids.max()) + 1
+
+    power_mean, power_max = bucket_mean_max(bucket_ids, np.asarray(power, dtype=np.float64)[graded], bucket_count)
+    hr_mean, hr_max = bucket_mean_max(bucket_ids, np.asarray(heartrate, dtype=np.float64)[graded], bucket_count)
+
+    return {
+        'gradient': (np.arange(bucket_count) + lowest) * bucket_width,
+        # Samples are one second apart so the count is the time in seconds
+        'duration': np.bincount(bucket_ids, minlength=bucket_count),
+        'power_mean': power_mean,
+        'power_max': power_max,
+        'hr_mean': hr_mean,
+        'hr_max': hr_max,
+    }
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from helpers.constants import *
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# How many missing seconds in a row are interpolated over at one second detail (the watch records intermittently)
+INTERPOLATION_LIMIT = 20
+
+
+def get_seconds_of_day(dataset: list):
+    # The second of the day of every sample, parsed in bulk. Fitbit times are always 'HH:MM:SS' so joining them gives
+    # a block of fixed width ASCII digits that can be read as one array rather than parsing every time separately
+    if len(dataset) == 0:
+        return np.array([], dtype=np.int32)
+
+    text = ''.join([sample[FITBIT_API_KEY_INTRADAY_TIME] for sample in dataset]).encode('ascii')
+    digits = (np.frombuffer(text, dtype=np.uint8).reshape(-1, 8) - ord('0')).astype(np.int32)
+    return (digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 3] * 10 + digits[:, 4]) * 60 + digits[:, 6] * 10 + digits[:, 7]
+
+
+def get_values(dataset: list):
+    return np.fromiter((sample[FITBIT_API_KEY_INTRADAY_VALUE] for sample in dataset), dtype=np.float64, count=len(dataset))
+
+
+def place(seconds: np.ndarray, values: np.ndarray, start: int, end: int, step: int):
+    # Put the samples on a regular grid of seconds from the start to the end (exclusive), NaN where there's no sample
+    grid = np.full((end - start + step - 1) // step, np.nan)
+    positions = (seconds - start) // step
+    in_range = (seconds >= start) & (positions < len(grid))
+    grid[positions[in_range]] = values[in_range]
+    return grid
+
+
+def interpolate_gaps(values: np.ndarray, limit: int = INTERPOLATION_LIMIT):
+    # Fill short gaps in a regular series (and up to the limit after the last sample) linearly
+    return pd.Series(values).interpolate(limit=limit).to_numpy()
+
@@ -0,0 +1,72 @@
+import numpy as np
+
+# The durations (seconds) that the power table shows
+STANDARD_DURATIONS = {
+    'one_second': 1,
+    'five_second': 5,
+    'thirty_second': 30,
+    'one_minute': 60,
+    'five_minute': 5 * 60,
+    'ten_minute': 10 * 60,
+    'twenty_minute': 20 * 60,
+}
+
+MAX_DURATION = 24 * 60 * 60
+
+
+def get_durations():
+    # Every second up to a minute then log-spaced up to a day, plus the standard durations.
+    # Every curve uses this same grid so curves from different rides can be compared element by element
+    return np.unique(np.concatenate([
+        np.arange(1, 61),
+        np.round(np.geomspace(60, MAX_DURATION, 160)),
+        list(STANDARD_DURATIONS.values())
+    ])).astype(np.int32)
+
+
+DURATIONS = get_durations()
+
+
+def get_power_curve(power: np.ndarray):
+    # Get the best average power for every duration in the grid (the mean-maximal power curve).
+    # Power must be sampled every second, NaN for missing samples. As with a rolling mean, any window containing a
+    # missing sample is ignored. Durations longer than the ride are NaN.
+    # Returns a dictionary of durations (seconds) and the best power for each
+    valid = ~np.isnan(power)
+
+    # With prefix sums the total over any window is just the difference between two elements, so each duration is one
+    # vectorised pass rather than a rolling window
+    cumulative_power = np.concatenate([[0], np.cumsum(np.where(valid, power, 0), dtype=np.float64)])
+    cumulative_missing = np.concatenate([[0], np.cumsum(~valid, dtype=np.int64)])
+
+    best = np.full(len(DURATIONS), np.nan, dtype=np.float32)
+    for index, duration in enumerate(DURATIONS):
+        window = int(duration)
+        if window > len(power):
+            break
+
+        totals = cumulative_power[window:] - cumulative_power[:-window]
+        complete = (cumulative_missing[window:] - cumulative_missing[:-window]) == 0
+        if complete.any():
+            best[index] = np.max(totals[complete]) / window
+
+    return {
+        'durations': DURATIONS,
+        'power': best,
+    }
+
+
+def get_power_at(power_curve, duration: int):
+    # The best power for one of the durations in the grid
+    index = np.searchsorted(power_curve['durations'], duration)
+    if index < len(power_curve['durations']) and power_curve['durations'][index] == duration:
+        return power_curve['power'][index]
+    return np.nan
+
+
+def merge_power_curves(curves: list):
+    # The best power for each duration across several curves (e.g. every ride in a season). Curves all share the same
+    # grid so this is an element-wise maximum, durations no ride was long enough for stay NaN
+    if len(curves) == 0:
+        return np.full(len(DURATIONS), np.nan, dtype=np.float32)
+    return np.fmax.reduce(np.stack(curves), axis=0)
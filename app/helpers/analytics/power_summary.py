@@ -0,0 +1,65 @@
+import numpy as np
+
+from helpers.constants import *
+
+NORMALISED_POWER_WINDOW = 30
+
+
+def rolling_mean(values: np.ndarray, window: int):
+    # The mean of every complete window (windows containing NaN are left out), from one cumulative sum
+    valid = ~np.isnan(values)
+    cumulative = np.concatenate([[0], np.cumsum(np.where(valid, values, 0), dtype=np.float64)])
+    cumulative_missing = np.concatenate([[0], np.cumsum(~valid, dtype=np.int64)])
+    if len(values) < window:
+        return np.array([], dtype=np.float64)
+
+    means = (cumulative[window:] - cumulative[:-window]) / window
+    return means[(cumulative_missing[window:] - cumulative_missing[:-window]) == 0]
+
+
+def get_power_state(power: np.ndarray, duration_seconds: int):
+    # Everything in the power summary that doesn't depend on FTP. This is worked out once when the activity is loaded
+    # so changing the FTP is just arithmetic.
+    # The histogram is the number of seconds spent at each whole Watt, stored cumulatively so the time in any range of
+    # power is the difference of two elements
+    # See this article for the maths:
+    # https://medium.com/critical-powers/formulas-from-training-and-racing-with-a-power-meter-2a295c661b46
+    thirty_second_means = rolling_mean(power, NORMALISED_POWER_WINDOW)
+    normalised_power = float(np.mean(thirty_second_means ** 4) ** 0.25) if len(thirty_second_means) > 0 else float('nan')
+
+    return {
+        'normalised_power': normalised_power,
+        'duration': int(duration_seconds),
+        'cumulative_histogram': get_cumulative_histogram(power),
+    }
+
+
+def get_cumulative_histogram(power: np.ndarray):
+    # The seconds at or below each whole Watt (the first element is zero), NaN samples are left out
+    valid_power = power[~np.isnan(power)]
+    histogram = np.bincount(np.clip(np.round(valid_power), 0, None).astype(np.int64))
+    return np.concatenate([[0], np.cumsum(histogram)]).astype(np.int32)
+
+
+def get_zone_seconds(cumulative_histogram: np.ndarray, ftp):
+    # Seconds between each pair of zone boundaries (converted to whole Watts and capped to the histogram). Every time
+    # in power zone (the power summary, a ride's zones and the weekly zones) comes from here so they all agree
+    boundaries = [0] + [int(np.ceil(upper * ftp)) for _, upper in POWER_ZONES[:-1]] + [len(cumulative_histogram) - 1]
+    boundaries = np.clip(boundaries, 0, len(cumulative_histogram) - 1)
+    return np.diff(cumulative_histogram[boundaries]).astype(np.int32)
+
+
+def get_power_summary(power_state, ftp):
+    # Work out the FTP dependent values (intensity factor, TSS and time in each zone) from the power state
+    normalised_power = power_state['normalised_power']
+    intensity_factor = normalised_power / ftp
+    tss = (power_state['duration'] * normalised_power * intensity_factor) / (ftp * 36)
+
+    zone_seconds = get_zone_seconds(power_state['cumulative_histogram'], ftp)
+
+    return {
+        'normalised_power': normalised_power,
+        'intensity_factor': intensity_factor,
+        'tss': tss,
+        'zones': [{'name': name, 'seconds': int(seconds)} for (name, _), seconds in zip(POWER_ZONES, zone_seconds)]
+    }
@@ -0,0 +1,51 @@
+import numpy as np
+
+# How the power in a pause (a gap in the recording longer than the longest coast) is filled
+# NaN leaves it out of averages and power curve windows altogether, zero treats it as coasting too
+GAP_FILL_ZERO = 'zero'
+GAP_FILL_NAN = 'nan'
+
+# Gaps (seconds) up to the maximum gap are smart recording and hold the last sample, longer ones up to the longest coast
+# are coasting (no power) and anything longer is a pause (e.g. a cafe stop or auto-pause)
+DEFAULT_MAX_GAP = 10
+DEFAULT_MAX_COAST = 30
+DEFAULT_GAP_FILL = GAP_FILL_NAN
+
+
+def resample_to_1hz(time: np.ndarray, columns: dict, interpolated: list = (), max_gap: int = DEFAULT_MAX_GAP, gap_fill: str = DEFAULT_GAP_FILL, gap_filled: list = (), max_coast: int = DEFAULT_MAX_COAST):
+    # Resample unevenly recorded columns (e.g. Strava's smart recording) to one sample per second using the time column.
+    # - Samples are held until the next one (smart recording only records when something changes) apart from the
+    #   interpolated columns (e.g. distance) which are interpolated linearly
+    # - Gaps longer than the maximum gap but no longer than the longest coast are coasting: the gap filled columns
+    #   (e.g. power) are zero and everything else is NaN
+    # - Longer gaps are pauses: the gap filled columns are filled with zero or NaN as configured (NaN by default) and
+    #   everything else is NaN
+    # Returns the new time column (every second from the first sample to the last) and the resampled columns
+    if len(time) == 0:
+        return time.astype(np.int32), {name: column.astype(np.float32) for name, column in columns.items()}
+
+    time = np.asarray(time, dtype=np.int64)
+    seconds = np.arange(time[0], time[-1] + 1, dtype=np.int64)
+
+    # The last sample at or before each second, and the length of the gap that second falls in
+    previous = np.searchsorted(time, seconds, side='right') - 1
+    gap = np.diff(time, append=time[-1])[previous]
+    in_gap = (gap > max_gap) & (seconds != time[previous])
+    in_pause = in_gap & (gap > max_coast)
+    in_coast = in_gap & ~in_pause
+
+    resampled = dict()
+    for name, column in columns.items():
+        column = np.asarray(column, dtype=np.float32)
+        if name in interpolated:
+            values = np.interp(seconds, time, column).astype(np.float32)
+        else:
+            values = column[previous]
+            if name in gap_filled:
+                values = np.where(in_coast, np.float32(0), values)
+                values = np.where(in_pause, np.float32(0) if gap_fill == GAP_FILL_ZERO else np.nan, values)
+            else:
+                values = np.where(in_gap, np.nan, values)
+        resampled[name] = values.astype(np.float32)
+
+    return seconds.astype(np.int32), resampled
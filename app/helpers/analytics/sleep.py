@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from helpers.constants import *
+
+# The stages sleeps long enough to be tracked with sleep stages are split into
+STAGES = [FITBIT_API_KEY_SLEEP_DEEP, FITBIT_API_KEY_SLEEP_LIGHT, FITBIT_API_KEY_SLEEP_REM, FITBIT_API_KEY_SLEEP_WAKE]
+
+# The levels of shorter (classic) sleeps
+CLASSIC_LEVELS = [FITBIT_API_KEY_SLEEP_ASLEEP, FITBIT_API_KEY_SLEEP_AWAKE, FITBIT_API_KEY_SLEEP_RESTLESS]
+
+
+def get_sleep_frame(sleep_history):
+    # Turn Fitbit's sleep logs into one table with a row per sleep, in the order Fitbit returns them.
+    # Columns are the date of the sleep, its start, duration (seconds), efficiency, whether it's a classic sleep (too
+    # short for sleep stages) and the minutes spent in every stage or level (NaN if the sleep doesn't have it)
+    sleeps = sleep_history[FITBIT_API_KEY_SLEEP]
+    levels = STAGES + CLASSIC_LEVELS
+
+    columns = {name: list() for name in ['log_id', 'date', 'start', 'duration', 'efficiency', 'classic', 'main'] + levels}
+    for sleep in sleeps:
+        summary = sleep[FITBIT_API_KEY_SLEEP_LEVELS][FITBIT_API_KEY_SLEEP_SUMMARY]
+        columns['log_id'].append(sleep.get(FITBIT_API_KEY_SLEEP_LOG_ID, 0))
+        columns['date'].append(sleep[FITBIT_API_KEY_SLEEP_DATE])
+        columns['start'].append(sleep.get(FITBIT_API_KEY_SLEEP_START, 'NaT'))
+        columns['duration'].append(sleep[FITBIT_API_KEY_SLEEP_DURATION] / 1000)
+        columns['efficiency'].append(sleep.get(FITBIT_API_KEY_SLEEP_EFFICIENCY, np.nan))
+        columns['classic'].append(sleep.get(FITBIT_API_KEY_SLEEP_TYPE, None) == FITBIT_SLEEP_TYPE_CLASSIC)
+        columns['main'].append(sleep.get(FITBIT_API_KEY_SLEEP_MAIN, True))
+        for level in levels:
+            columns[level].append(summary[level][FITBIT_API_KEY_SLEEP_MINUTES] if level in summary else np.nan)
+
+    return pd.DataFrame({
+        'log_id': np.array(columns['log_id'], dtype=np.int64),
+        'date': np.array(columns['date'], dtype='datetime64[D]'),
+        'start': np.array(columns['start'], dtype='datetime64[ms]'),
+        'duration': np.array(columns['duration'], dtype=np.float64),
+        'efficiency': np.array(columns['efficiency'], dtype=np.float64),
+        'classic': np.array(columns['classic'], dtype=bool),
+        'main': np.array(columns['main'], dtype=bool),
+        **{level: np.array(columns[level], dtype=np.float64) for level in levels}
+    })
+
+
+def get_sleep_periods(sleep_history):
+    # Every period of every sleep (a stretch spent in one stage or level) as one table, in time order. Columns are the
+    # sleep it belongs to, the date of that sleep, its start, length (seconds) and the stage or level
+    sleeps = sleep_history[FITBIT_API_KEY_SLEEP]
+    periods = [
+        (sleep.get(FITBIT_API_KEY_SLEEP_LOG_ID, 0), sleep[FITBIT_API_KEY_SLEEP_DATE], period)
+        for sleep in sleeps
+        for period in sleep[FITBIT_API_KEY_SLEEP_LEVELS][FITBIT_API_KEY_SLEEP_DATA]
+    ]
+
+    # Fitbit times are ISO 8601 local times, which numpy parses in bulk
+    frame = pd.DataFrame({
+        'log_id': np.array([log_id for log_id, _, _ in periods], dtype=np.int64),
+        'date': np.array([day for _, day, _ in periods], dtype='datetime64[D]'),
+        'start': np.array([period[FITBIT_API_KEY_SLEEP_DATE_TIME] for _, _, period in periods], dtype='datetime64[ms]'),
+        'seconds': np.array([period[FITBIT_API_KEY_SLEEP_SECONDS] for _, _, period in periods], dtype=np.int64),
+        'level': np.array([period[FITBIT_API_KEY_SLEEP_LEVEL] for _, _, period in periods], dtype=object),
+    })
+    return frame.sort_values('start', kind='stable', ignore_index=True)
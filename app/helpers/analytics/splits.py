@@ -0,0 +1,53 @@
+import numpy as np
+
+
+def get_prefix_sums(values: np.ndarray):
+    # Cumulative sums of the values (missing ones counted as zero) and of the number of valid values, from which the
+    # NaN-aware mean of any range is two subtractions
+    valid = ~np.isnan(values)
+    return (
+        np.concatenate([[0], np.cumsum(np.where(valid, values, 0), dtype=np.float64)]),
+        np.concatenate([[0], np.cumsum(valid, dtype=np.int64)])
+    )
+
+
+def get_range_means(prefix_sums, boundaries: np.ndarray):
+    # The mean between each pair of consecutive boundaries (sample indices), None where there's no data
+    cumulative, cumulative_count = prefix_sums
+    totals = np.diff(cumulative[boundaries])
+    counts = np.diff(cumulative_count[boundaries])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = totals / counts
+    return [float(m) if c > 0 else None for m, c in zip(means, counts)]
+
+
+def get_count_boundaries(length: int, split_count: int):
+    # Boundaries splitting a number of samples into nearly equal parts, the first parts get the extra samples
+    # (the same as numpy's array_split)
+    size, extra = divmod(length, split_count)
+    sizes = np.full(split_count, size, dtype=np.int64)
+    sizes[:extra] += 1
+    return np.concatenate([[0], np.cumsum(sizes)])
+
+
+def get_split_means(values: np.ndarray, split_counts: list, prefix_sums=None):
+    # The mean of the values in each of a number of equal splits, for several numbers of splits at once
+    prefix_sums = prefix_sums if prefix_sums is not None else get_prefix_sums(values)
+    return [
+        {
+            'split_count': split_count,
+            'splits': get_range_means(prefix_sums, get_count_boundaries(len(values), split_count))
+        }
+        for split_count in split_counts
+    ]
+
+
+def get_time_split_means(values: np.ndarray, time: np.ndarray, split_seconds: int, prefix_sums=None):
+    # The mean of the values in consecutive blocks of time (e.g. every five minutes)
+    prefix_sums = prefix_sums if prefix_sums is not None else get_prefix_sums(values)
+    if len(time) == 0:
+        return []
+    edges = np.arange(time[0], time[-1] + split_seconds, split_seconds)
+    boundaries = np.searchsorted(time, edges, side='left')
+    boundaries[-1] = len(time)
+    return get_range_means(prefix_sums, boundaries)
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+# Time constants (days) of the fitness (chronic training load) and fatigue (acute training load) averages
+FITNESS_TIME_CONSTANT = 42
+FATIGUE_TIME_CONSTANT = 7
+
+
+def get_load(normalised_power: float, duration_seconds: float):
+    # The training load of a ride without the FTP, TSS is this divided by FTP squared (and 36).
+    # TSS = seconds * NP * IF / (FTP * 3600) * 100 = seconds * NP^2 / (FTP^2 * 36), so every sum and average of TSS can
+    # be worked out in these units and scaled once the FTP is known, and changing the FTP doesn't mean recomputing
+    # anything
+    if normalised_power is None or np.isnan(normalised_power) or duration_seconds is None:
+        return 0.0
+    return float(duration_seconds) * float(normalised_power) ** 2
+
+
+def to_tss(load, ftp: float):
+    return np.asarray(load) / (float(ftp) ** 2 * 36)
+
+
+def exponentially_weighted(daily_loads: np.ndarray, time_constant: int, initial: float = 0.0):
+    # The exponentially weighted average of the daily loads (today = yesterday + (load - yesterday) / time constant),
+    # carrying on from the value on the day before the first load
+    series = pd.Series(np.concatenate([[initial], daily_loads]))
+    return series.ewm(alpha=1 / time_constant, adjust=False).mean().to_numpy()[1:]
+
+
+def get_daily_state(daily_loads: np.ndarray, initial_fitness: float = 0.0, initial_fatigue: float = 0.0):
+    # Fitness and fatigue at the end of each day
+    return (
+        exponentially_weighted(daily_loads, FITNESS_TIME_CONSTANT, initial_fitness),
+        exponentially_weighted(daily_loads, FATIGUE_TIME_CONSTANT, initial_fatigue)
+    )
+
+
+def get_form(fitness: np.ndarray, fatigue: np.ndarray, initial_fitness: float = 0.0, initial_fatigue: float = 0.0):
+    # Form (training stress balance) going into each day, i.e. the end of the previous day's fitness minus its fatigue
+    return np.concatenate([[initial_fitness - initial_fatigue], (fitness - fatigue)[:-1]]) if len(fitness) > 0 else np.array([])
@@ -0,0 +1,52 @@
+import numpy as np
+
+import helpers.analytics.power_summary as power_summary
+import helpers.common as common
+from helpers.constants import *
+
+ZONES_POWER = 'power'
+ZONES_HEART_RATE = 'heart_rate'
+
+# Part of every definition, bumped when the way the seconds are worked out changes so stored histograms are redone
+HISTOGRAM_VERSION = 2
+
+
+def get_zone_limits(zones: list, threshold: float):
+    # The upper limit of every zone but the last in the units of the stream (e.g. Watts)
+    return np.array([upper * threshold for _, upper in zones[:-1]], dtype=np.float64)
+
+
+def get_definition(kind: str, zones: list, threshold: float):
+    # A name for a set of zones and the threshold they're based on, histograms are stored against this so changing the
+    # FTP or the zones doesn't pick up histograms worked out for the old ones
+    return f'{kind}:v{HISTOGRAM_VERSION}:{threshold:g}:' + ','.join(f'{upper:g}' for _, upper in zones[:-1])
+
+
+def get_zone_seconds(values: np.ndarray, limits: np.ndarray):
+    # The number of seconds in each zone (a value on a zone's upper limit is in the next zone up).
+    # Values must be sampled every second, NaN samples are left out
+    values = values[~np.isnan(values)]
+    return np.bincount(np.digitize(values, limits), minlength=len(limits) + 1).astype(np.int32)
+
+
+def get_activity_zone_seconds(activity_stream, kind: str, zones: list, threshold: float):
+    # The seconds in each zone of a ride. Power uses the power summary's whole Watt histogram so a ride's zones match
+    # its power summary exactly
+    if kind == ZONES_POWER:
+        return power_summary.get_zone_seconds(power_summary.get_cumulative_histogram(activity_stream.power), threshold)
+    return get_zone_seconds(activity_stream.heartrate, get_zone_limits(zones, threshold))
+
+
+def get_zone_definitions(ftp):
+    # The zones to work out: power zones if we have an FTP and heart rate zones if either a maximum or a threshold heart
+    # rate has been configured. Returns a list of (kind, zones, threshold)
+    definitions = list()
+    if ftp:
+        definitions.append((ZONES_POWER, POWER_ZONES, float(ftp)))
+
+    heart_rate_config = common.get_config_section('zones').get('heart_rate', None) or {}
+    if heart_rate_config.get('threshold', None):
+        definitions.append((ZONES_HEART_RATE, HEART_RATE_ZONES_THRESHOLD, float(heart_rate_config['threshold'])))
+    elif heart_rate_config.get('max', None):
+        definitions.append((ZONES_HEART_RATE, HEART_RATE_ZONES_MAX, float(heart_rate_config['max'])))
+    return definitions
@@ -0,0 +1,27 @@
+import threading
+
+import helpers.api.rate_limit as rate_limit
+
+_running = set()
+_running_lock = threading.Lock()
+
+
+def start(key: str, function):
+    # Run some backfill (a function with no arguments) on a thread of its own so the page that needed it doesn't wait
+    # for it. It's background work for the rate limiter, and only one backfill for a key runs at a time in this process.
+    # Returns whether it was started (False if it was already running)
+    with _running_lock:
+        if key in _running:
+            return False
+        _running.add(key)
+
+    def run():
+        try:
+            with rate_limit.background():
+                function()
+        finally:
+            with _running_lock:
+                _running.discard(key)
+
+    threading.Thread(target=run, name=f'backfill-{key}', daemon=True).start()
+    return True
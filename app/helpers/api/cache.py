@@ -0,0 +1,294 @@
+import collections
+import contextlib
+import functools
+import hashlib
+import inspect
+import pickle
+import threading
+import time
+import redis
+from datetime import datetime, timedelta
+
+import helpers.api.single_flight as single_flight
+import helpers.common as common
+
+# Special TTL values
+# FOREVER is used for data that can't change any more (e.g. a day that finished a while ago)
+# UNTIL_SYNC is used for data that only changes when the Fitbit device syncs, it expires when a new sync is seen
+FOREVER = None
+UNTIL_SYNC = 'until-sync'
+
+DEFAULT_SYNC_MAX_AGE = 24 * 60 * 60
+DEFAULT_REDIS_DB = 1
+LOCK_TIMEOUT = 60
+KEY_PREFIX = 'cache'
+
+# The most access tokens whose owner is remembered in this process, and how long (seconds) an owner looked up from the
+# backend is remembered for (registered ones are remembered until their token expires)
+MAX_REMEMBERED_OWNERS = 1024
+REMEMBERED_OWNER_TTL = 60 * 60
+
+_backend = None
+_backend_lock = threading.Lock()
+_stats = dict()
+_stats_lock = threading.Lock()
+_owners = collections.OrderedDict()
+_owners_lock = threading.Lock()
+_local = threading.local()
+
+
+class NotCached(Exception):
+    pass
+
+
+class Partial:
+    # What a cached helper returns when its result is missing something it will have later (e.g. the older part of a
+    # range that is still being backfilled). The value is returned as usual but isn't kept in the cache
+
+    def __init__(self, value):
+        self.value = value
+
+
+class MemoryBackend:
+    # In-process fallback for when Redis isn't configured. Values are stored with their expiry time.
+
+    def __init__(self):
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.values.get(key, None)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                del self.values[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.values[key] = (value, None if ttl is None else time.time() + ttl)
+
+    def delete_prefix(self, prefix):
+        with self.lock:
+            for key in [k for k in self.values if k.startswith(prefix)]:
+                del self.values[key]
+
+    def lock_key(self, key):
+        # Nothing to coordinate with outside this process
+        return contextlib.nullcontext()
+
+
+class RedisBackend:
+
+    def __init__(self, host, port, db):
+        self.redis = redis.Redis(host=host, port=port, db=db)
+
+    def get(self, key):
+        return self.redis.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.redis.set(key, value, ex=None if ttl is None else max(int(ttl), 1))
+
+    def delete_prefix(self, prefix):
+        keys = list(self.redis.scan_iter(match=f'{prefix}*'))
+        if len(keys) > 0:
+            self.redis.delete(*keys)
+
+    def lock_key(self, key):
+        # A lock shared by every process using this Redis server. It expires in case the holder dies.
+        if not common.get_config_section('cache').get('distributed_single_flight', True):
+            return contextlib.nullcontext()
+        return self.redis.lock(f'{KEY_PREFIX}:lock:{key}', timeout=LOCK_TIMEOUT, blocking_timeout=LOCK_TIMEOUT)
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def create_backend():
+    cache_config = common.get_config_section('cache')
+    session_config = common.get_config_section('session')
+
+    # Use the cache section if there is one, otherwise share the Redis server used for sessions (in another database)
+    cache_type = cache_config.get('type', 'redis' if session_config.get('type', None) == 'redis' else 'memory')
+    if cache_type == 'redis':
+        return RedisBackend(
+            cache_config.get('redis_host', session_config.get('redis_host', None)),
+            cache_config.get('redis_port', session_config.get('redis_port', 6379)),
+            cache_config.get('redis_db', DEFAULT_REDIS_DB)
+        )
+    return MemoryBackend()
+
+
+def hash_value(value):
+    return hashlib.sha256(str(value).encode('utf-8')).hexdigest()[:32]
+
+
+def remember_owner(access_token: str, owner: str, ttl: int = None):
+    # Keep the owner of a token in this process so it isn't looked up on every call. Tokens are refreshed every few
+    # hours so the oldest are forgotten once there are too many, and each one is forgotten when it expires
+    now = time.time()
+    with _owners_lock:
+        _owners[access_token] = (owner, now + (ttl if ttl is not None else REMEMBERED_OWNER_TTL))
+        _owners.move_to_end(access_token)
+        while len(_owners) > MAX_REMEMBERED_OWNERS or next(iter(_owners.values()))[1] < now:
+            _owners.popitem(last=False)
+
+
+def get_remembered_owner(access_token: str):
+    with _owners_lock:
+        entry = _owners.get(access_token, None)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+
+def register_owner(access_token: str, owner: str, ttl: int = None):
+    # Record which athlete an access token belongs to. Cached data is keyed by athlete rather than token so it survives
+    # the token being refreshed.
+    if access_token is None or owner is None or get_remembered_owner(access_token) == owner:
+        return
+    remember_owner(access_token, owner, ttl)
+    get_backend().set(f'{KEY_PREFIX}:token:{hash_value(access_token)}', owner.encode('utf-8'), ttl)
+
+
+def get_owner(access_token: str):
+    owner = get_remembered_owner(access_token)
+    if owner is None:
+        stored = get_backend().get(f'{KEY_PREFIX}:token:{hash_value(access_token)}')
+        # Fall back to the token itself if we don't know who it belongs to
+        owner = stored.decode('utf-8') if stored is not None else f'token-{hash_value(access_token)}'
+        remember_owner(access_token, owner)
+    return owner
+
+
+def get_sync_generation(owner: str):
+    generation = get_backend().get(f'{KEY_PREFIX}:{owner}:sync')
+    return generation.decode('utf-8') if generation is not None else 'none'
+
+
+def record_sync(access_token: str, last_sync_time: str):
+    # Data cached UNTIL_SYNC is keyed by the last sync time, recording a new sync time makes it unreachable
+    if last_sync_time is not None:
+        get_backend().set(f'{KEY_PREFIX}:{get_owner(access_token)}:sync', last_sync_time.encode('utf-8'))
+
+
+def ttl_for_day(day: datetime):
+    # Days that finished before yesterday won't change any more. Yesterday (and the default of None, which the helpers
+    # treat as yesterday or today) can still change until the device syncs
+    if day is not None and day.date() < (datetime.now() - timedelta(days=1)).date():
+        return FOREVER
+    return UNTIL_SYNC
+
+
+def seconds_until_midnight():
+    now = datetime.now()
+    midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+    return (midnight - now).total_seconds()
+
+
+def invalidate(access_token: str, endpoint: str = None):
+    # Remove everything cached for the owner of an access token, or just one endpoint
+    owner = get_owner(access_token)
+    prefix = f'{KEY_PREFIX}:{owner}:' if endpoint is None else f'{KEY_PREFIX}:{owner}:{endpoint}:'
+    get_backend().delete_prefix(prefix)
+
+
+def get_object(name: str):
+    # Get something stored with set_object (rather than an API response), None if it isn't there
+    stored = get_backend().get(f'{KEY_PREFIX}:object:{name}')
+    return pickle.loads(stored) if stored is not None else None
+
+
+def set_object(name: str, value, ttl=FOREVER):
+    # Store something we've worked out (rather than an API response) so other requests and processes can use it
+    get_backend().set(f'{KEY_PREFIX}:object:{name}', pickle.dumps(value), ttl)
+
+
+def is_cache_only():
+    return getattr(_local, 'cache_only', False)
+
+
+@contextlib.contextmanager
+def cache_only():
+    # Cached helpers called inside this block only return what's already in the cache, they raise NotCached rather
+    # than calling the API
+    previous = is_cache_only()
+    _local.cache_only = True
+    try:
+        yield
+    finally:
+        _local.cache_only = previous
+
+
+def count(endpoint: str, outcome: str):
+    with _stats_lock:
+        endpoint_stats = _stats.setdefault(endpoint, {'hits': 0, 'misses': 0})
+        endpoint_stats[outcome] += 1
+
+
+def get_stats():
+    # Hit and miss counts per endpoint for this process
+    with _stats_lock:
+        return {endpoint: dict(endpoint_stats) for endpoint, endpoint_stats in _stats.items()}
+
+
+def cached(endpoint: str, ttl=FOREVER):
+    # Cache the result of an API helper. The helper's first argument must be the access token, the rest of the
+    # arguments make up the key. The TTL is a number of seconds, FOREVER or UNTIL_SYNC, or a function taking the
+    # helper's arguments (as a dictionary) that returns one of those.
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(access_token, *args, **kwargs):
+            bound = signature.bind(access_token, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            arguments.pop('access_token', None)
+
+            entry_ttl = ttl(arguments) if callable(ttl) else ttl
+            owner = get_owner(access_token)
+            key = f'{KEY_PREFIX}:{owner}:{endpoint}:'
+            if entry_ttl == UNTIL_SYNC:
+                # Never keep data that waits for a sync past midnight, "today" and "yesterday" move on
+                key = f'{key}{get_sync_generation(owner)}:'
+                entry_ttl = min(common.get_config_section('cache').get('sync_max_age', DEFAULT_SYNC_MAX_AGE), seconds_until_midnight())
+            key = f'{key}{hash_value(sorted(arguments.items()))}'
+
+            backend = get_backend()
+            stored = backend.get(key)
+            if stored is not None:
+                count(endpoint, 'hits')
+                return pickle.loads(stored)
+            if is_cache_only():
+                raise NotCached(f'{endpoint} is not cached')
+
+            def load():
+                # Another thread or process may have fetched this while we waited for the lock
+                stored = backend.get(key)
+                if stored is not None:
+                    return stored
+                count(endpoint, 'misses')
+                result = function(access_token, *args, **kwargs)
+                if isinstance(result, Partial):
+                    return pickle.dumps(result.value)
+                stored = pickle.dumps(result)
+                backend.set(key, stored, entry_ttl)
+                return stored
+
+            # Concurrent misses for the same key share a single upstream call. Each caller unpickles its own copy so
+            # they can't change each other's results.
+            return pickle.loads(single_flight.do(key, load, backend.lock_key(key)))
+
+        return wrapper
+
+    return decorator
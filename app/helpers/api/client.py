@@ -0,0 +1,71 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+import helpers.api.rate_limit as rate_limit
+import helpers.common as common
+
+# Defaults used when the http section of the config is missing or incomplete
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # A single session is shared by every API helper so connections to Fitbit and Strava are kept alive and reused
+    # rather than doing a new TCP and TLS handshake on every call
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def create_session():
+    http_config = common.get_config_section('http')
+
+    # The adapter keeps one pool per host, pool_connections is the number of host pools it keeps and pool_maxsize is
+    # the number of connections kept open to each host (this needs to be at least the number of concurrent fetches)
+    adapter = HTTPAdapter(
+        pool_connections=http_config.get('pool_connections', DEFAULT_POOL_CONNECTIONS),
+        pool_maxsize=http_config.get('pool_maxsize', DEFAULT_POOL_MAXSIZE),
+        max_retries=http_config.get('max_retries', 0)
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    # Ask for compressed responses, the intraday and stream payloads are large but compress very well
+    session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+    return session
+
+
+def get_timeout():
+    # Requests has no timeout by default so a stuck call would hang the worker forever
+    http_config = common.get_config_section('http')
+    return (
+        http_config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+        http_config.get('read_timeout', DEFAULT_READ_TIMEOUT)
+    )
+
+
+def get(url: str, headers: dict = None, params: dict = None):
+    return rate_limit.send(lambda: get_session().get(url, headers=headers, params=params, timeout=get_timeout()), url, headers)
+
+
+def post(url: str, data: dict = None, headers: dict = None):
+    return rate_limit.send(lambda: get_session().post(url, data=data, headers=headers, timeout=get_timeout()), url, headers)
+
+
+def get_json(url: str, headers: dict = None, params: dict = None):
+    response = get(url, headers=headers, params=params)
+
+    # Raise on error responses rather than handing their JSON back as if it were data (it would end up cached)
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,131 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import helpers.api.rate_limit as rate_limit
+import helpers.common as common
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_CHUNK_WORKERS = 4
+
+_executor = None
+_chunk_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # A bounded pool shared by every page so a burst of page views can't open an unbounded number of upstream calls
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = common.get_config_section('fetch').get('max_workers', DEFAULT_MAX_WORKERS)
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+    return _executor
+
+
+def get_chunk_executor():
+    # Chunked range fetches are started from calls already running on the shared pool. Waiting on the shared pool from
+    # one of its own workers could leave no worker free to run the chunks, so they get a (smaller) pool of their own
+    global _chunk_executor
+    if _chunk_executor is None:
+        with _executor_lock:
+            if _chunk_executor is None:
+                max_workers = common.get_config_section('fetch').get('chunk_workers', DEFAULT_CHUNK_WORKERS)
+                _chunk_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch-chunk')
+    return _chunk_executor
+
+
+def with_priority(function):
+    # The worker threads don't know whether the caller is doing background work, wrap the call to tell them
+    if not rate_limit.is_background():
+        return function
+
+    def background_function(*arguments):
+        with rate_limit.background():
+            return function(*arguments)
+    return background_function
+
+
+def fetch_all(calls: dict):
+    # Issue independent API calls together and wait for all of them.
+    # The calls are a dictionary of name to (function, arguments). The functions run on worker threads so they can't
+    # touch the Flask session, read any tokens on the request thread and pass them in as arguments.
+    # Returns a dictionary of results and a dictionary of errors, both keyed by the call name
+    executor = get_executor()
+    futures = {name: executor.submit(with_priority(function), *arguments) for name, (function, arguments) in calls.items()}
+
+    results = dict()
+    errors = dict()
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors[name] = e
+
+    return results, errors
+
+
+def fetch_plan(plan: dict):
+    # Run a set of API calls that depend on each other as soon as their dependencies are available.
+    # The plan is a dictionary of name to (function, arguments, dependencies). Each function is called with its
+    # arguments followed by the results of its dependencies (in the order they're listed). If a call fails then every
+    # call that depends on it fails too without being made.
+    # Returns a dictionary of results and a dictionary of errors, both keyed by the call name
+    executor = get_executor()
+    results = dict()
+    errors = dict()
+    pending = dict(plan)
+    running = dict()
+
+    while pending or running:
+        # Start everything whose dependencies have all been resolved (repeating until nothing changes so failures
+        # cascade down chains of dependencies)
+        changed = True
+        while changed:
+            changed = False
+            for name, (function, arguments, dependencies) in list(pending.items()):
+                failed = [d for d in dependencies if d in errors]
+                if len(failed) > 0:
+                    errors[name] = Exception(f'Dependency {failed[0]} failed')
+                    del pending[name]
+                    changed = True
+                elif all(d in results for d in dependencies):
+                    running[executor.submit(with_priority(function), *arguments, *[results[d] for d in dependencies])] = name
+                    del pending[name]
+
+        if not running:
+            # Anything left over depends on a call that isn't in the plan
+            for name in pending:
+                errors[name] = Exception(f'Unresolvable dependencies for {name}')
+            break
+
+        # Wait for at least one call to finish, it may unblock others
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+
+    return results, errors
+
+
+def fetch_chunks(function, arguments: tuple, chunks: list, budget: tuple = None):
+    # Call a function for every chunk of a range at once, each call gets the arguments followed by the chunk (e.g. its
+    # start and end). Every call still takes its turn with the rate limiter. Returns the results in chunk order and
+    # raises the first error.
+    # Backfills give the (provider, user) budget they're spending instead: the chunks are fetched one after another,
+    # stopping as soon as the budget is down to the part kept for interactive requests. Chunks that weren't fetched
+    # are None
+    if budget is not None:
+        results = [None] * len(chunks)
+        for index, chunk in enumerate(chunks):
+            if not rate_limit.has_background_budget(*budget):
+                break
+            results[index] = function(*arguments, *chunk)
+        return results
+
+    executor = get_chunk_executor()
+    futures = [executor.submit(with_priority(function), *arguments, *chunk) for chunk in chunks]
+    return [future.result() for future in futures]
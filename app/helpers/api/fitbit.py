@@ -1,50 +1,171 @@
-import requests
-from datetime import datetime, timedelta
+import helpers.api.backfill as backfill
+import helpers.api.client as client
+import helpers.api.cache as cache
+import helpers.api.fetch as fetch
+import helpers.api.rate_limit as rate_limit
+import helpers.api.single_flight as single_flight
+import helpers.common as common
+import helpers.analytics.intraday as intraday
+import helpers.analytics.sleep as sleep
+import helpers.storage.intraday_heart_rate as intraday_heart_rate
+from datetime import date, datetime, timedelta
 import pandas as pd
 import numpy as np
 from helpers.constants import *
 
 
-def get_heart_rate_history(access_token: str, days: int = 30):
-    # Get some data
-    endpoint = f'https://api.fitbit.com/1/user/-/activities/heart/date/today/{days}d.json'
+# The longest ranges (days) Fitbit answers in one request
+SLEEP_RANGE_DAYS = 100
+HEART_RATE_RANGE_DAYS = 365
+
+# How many of the most recent days of a range are fetched while the page waits, older days are backfilled
+DEFAULT_INTERACTIVE_DAYS = 30
+
+# How many times a caller tries to get the part of a day it needs into the intraday heart rate store: its own fetch, or
+# someone else's it waited for and then its own
+HEART_RATE_DAY_ATTEMPTS = 2
+
+
+def get_chunks(start: date, end: date, chunk_days: int):
+    # Split the days from the start to the end (both inclusive) into (start, end) chunks Fitbit will answer in one go.
+    # Chunks are aligned to multiples of the chunk length (counting from 0001-01-01) rather than to the start, so
+    # different ranges share chunks and a finished chunk is cached once for all of them. The last chunk stops at today
+    today = date.today()
+    chunks = list()
+    for index in range(start.toordinal() // chunk_days, end.toordinal() // chunk_days + 1):
+        chunk_start = date.fromordinal(max(index * chunk_days, 1))
+        chunk_end = min(date.fromordinal((index + 1) * chunk_days - 1), today)
+        if chunk_start <= chunk_end:
+            chunks.append((chunk_start, chunk_end))
+    return chunks
+
+
+def fetch_range(function, access_token: str, start: date, end: date, chunk_days: int):
+    # Call a chunk helper for every chunk of a range. Chunks with recent days (the default view) are fetched now like
+    # any other request, older ones only if they're already cached. Any older chunks that aren't are backfilled in the
+    # background, newest first, for as long as the budget lasts, so they show the next time the range is viewed.
+    # Returns the results of the chunks we have and whether that's all of them
+    chunks = get_chunks(start, end, chunk_days)
+    interactive_start = date.today() - timedelta(days=common.get_config_section('sync').get('fitbit_interactive_days', DEFAULT_INTERACTIVE_DAYS))
+    results = fetch.fetch_chunks(function, (access_token,), [c for c in chunks if c[1] >= interactive_start])
+
+    missing = list()
+    with cache.cache_only():
+        for chunk in [c for c in chunks if c[1] < interactive_start]:
+            try:
+                results.append(function(access_token, *chunk))
+            except cache.NotCached:
+                missing.append(chunk)
+
+    if len(missing) > 0:
+        owner = cache.get_owner(access_token)
+        backfill.start(
+            f'{function.__name__}:{owner}:{missing[0][0].isoformat()}:{missing[-1][1].isoformat()}',
+            lambda: fetch.fetch_chunks(function, (access_token,), missing[::-1], (rate_limit.PROVIDER_FITBIT, owner))
+        )
+    return results, len(missing) == 0
+
+
+def ttl_for_range(arguments: dict):
+    # A range is kept for good once its last day is over, like a single day
+    return cache.ttl_for_day(datetime.combine(arguments['end'], datetime.min.time()))
+
+
+@cache.cached('heart-rate-days', ttl=ttl_for_range)
+def get_heart_rate_days_chunk(access_token: str, start: date, end: date):
+    endpoint = f'https://api.fitbit.com/1/user/-/activities/heart/date/{start.isoformat()}/{end.isoformat()}.json'
     headers = {"Authorization": f"Bearer {access_token}"}
-    return requests.get(endpoint, headers=headers).json()
+    return client.get_json(endpoint, headers=headers)
 
 
-def get_heart_rate_detailed(access_token: str, day: datetime = None, detail: str = '1min'):
-    if day is None:
-        day = datetime.now() - timedelta(days=1)
+def get_heart_rate_days(access_token: str, start: date, end: date):
+    # The daily heart rate summaries (e.g. resting heart rate) from the start to the end day, any number of years long.
+    # Returned in the same shape as a single Fitbit response. Days beyond the default view are backfilled (see
+    # fetch_range)
+    chunks, _ = fetch_range(get_heart_rate_days_chunk, access_token, start, end, HEART_RATE_RANGE_DAYS)
+
+    # Chunks start before and end after the range, and days are only kept once
+    days = dict()
+    for chunk in chunks:
+        for day in chunk[FITBIT_API_KEY_HR_ACTIVITY]:
+            if start.isoformat() <= day[FITBIT_API_KEY_DATETIME] <= end.isoformat():
+                days[day[FITBIT_API_KEY_DATETIME]] = day
+    return {FITBIT_API_KEY_HR_ACTIVITY: [days[day] for day in sorted(days)]}
+
+
+def seconds_to_time(seconds: int):
+    return f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}'
 
+
+def fetch_heart_rate_intraday(access_token: str, day: datetime, detail: str, start_time: str = None, end_time: str = None):
+    # Get the raw intraday heart rate samples for a day, or just part of it if given start and end times ('HH:MM', both
+    # inclusive)
     yesterday = datetime.strftime(day, '%Y-%m-%d')
 
     # Get some data
     endpoint = f'https://api.fitbit.com/1/user/-/activities/heart/date/{yesterday}/1d/{detail}.json'
+    if start_time is not None and end_time is not None:
+        endpoint = f'https://api.fitbit.com/1/user/-/activities/heart/date/{yesterday}/1d/{detail}/time/{start_time}/{end_time}.json'
     headers = {"Authorization": f"Bearer {access_token}"}
-    response = requests.get(endpoint, headers=headers).json()
-    dataset = response[FITBIT_API_KEY_HR_INTRADAY][FITBIT_API_KEY_INTRADAY_DATASET]
+    response = client.get_json(endpoint, headers=headers)
+    return response[FITBIT_API_KEY_HR_INTRADAY][FITBIT_API_KEY_INTRADAY_DATASET]
 
-    # Create a dataframe from the heartrate data so we can use other pandas features
-    df = pd.DataFrame(
-        {
-            'hr': list(map(lambda w: w[FITBIT_API_KEY_INTRADAY_VALUE], dataset))
-        },
-        index=list(map(lambda x: datetime.strptime(f'{yesterday}T{x[FITBIT_API_KEY_INTRADAY_TIME]}Z', UTC_DATE_FORMAT), dataset))
-    )
 
-    start = datetime.strptime(f'{yesterday}T00:00:00Z', UTC_DATE_FORMAT)
+def fill_heart_rate_store(access_token: str, owner: str, day: date, start: int, end: int, sync_generation: str):
+    # Fetch whatever the intraday heart rate store is missing for [start, end) seconds of a day, in one request
+    missing = intraday_heart_rate.get_missing(owner, day, start, end, sync_generation)
+    if len(missing) == 0:
+        return
 
-    # If the detail level is 1 second then we will interpolate across 20 sec to allow for intermittent results
-    if detail == '1sec':
-        end = datetime.strptime(f'{yesterday}T23:59:59Z', UTC_DATE_FORMAT)
-        new_index = pd.Index(np.arange(start, end, timedelta(seconds=1)))
-        return df.reindex(new_index).interpolate(limit=20)
+    # Fitbit's ranges are whole minutes
+    first = missing[0][0] // 60 * 60
+    last = min(-(-missing[-1][1] // 60) * 60, intraday_heart_rate.SECONDS_PER_DAY)
+    if first == 0 and last == intraday_heart_rate.SECONDS_PER_DAY:
+        dataset = fetch_heart_rate_intraday(access_token, day, '1sec')
     else:
-        end = datetime.strptime(f'{yesterday}T23:59:00Z', UTC_DATE_FORMAT)
-        new_index = pd.Index(np.arange(start, end, timedelta(minutes=1)))
-        return df.reindex(new_index)
+        dataset = fetch_heart_rate_intraday(access_token, day, '1sec', seconds_to_time(first), seconds_to_time(last - 60))
+
+    grid = intraday.place(intraday.get_seconds_of_day(dataset), intraday.get_values(dataset), first, last, 1)
+    intraday_heart_rate.save(owner, day, first, grid, sync_generation)
+
+
+def get_heart_rate_range(access_token: str, start: datetime, end: datetime):
+    # Get the heart rate for every second in [start, end) (which can cross midnight) from the intraday heart rate store,
+    # fetching any part of it the store doesn't have yet. Short gaps are interpolated
+    owner = cache.get_owner(access_token)
+    sync_generation = cache.get_sync_generation(owner)
+    for day, day_start, day_end in intraday_heart_rate.get_days(start, end):
+        # One fetch per day at a time so writes to a day never overlap. A caller that waited for someone else's fetch
+        # (which may have been for another part of the day) checks once more for what it still needs, anything still
+        # missing after that is left as a gap
+        for _ in range(HEART_RATE_DAY_ATTEMPTS):
+            if len(intraday_heart_rate.get_missing(owner, day, day_start, day_end, sync_generation)) == 0:
+                break
+            single_flight.do(
+                f'heart-rate-day:{owner}:{day.isoformat()}',
+                lambda: fill_heart_rate_store(access_token, owner, day, day_start, day_end, sync_generation)
+            )
+
+    values = intraday.interpolate_gaps(intraday_heart_rate.load_range(owner, start, end))
+    index = np.datetime64(start, 's') + np.arange(len(values)).astype('timedelta64[s]')
+    return pd.DataFrame({'hr': values}, index=pd.DatetimeIndex(index.astype('datetime64[ns]')))
+
 
+def is_heart_rate_complete(access_token: str, start: datetime, end: datetime):
+    # Whether Fitbit has all of the heart rate for [start, end) (the device has synced since the end of every day it
+    # touches), rather than just what the device had synced when it was fetched
+    return intraday_heart_rate.is_range_complete(cache.get_owner(access_token), start, end)
 
+
+def get_day_heart_rate(access_token: str, day: datetime = None):
+    # The heart rate for every second of a day (yesterday by default)
+    if day is None:
+        day = datetime.now() - timedelta(days=1)
+    start = datetime(day.year, day.month, day.day)
+    return get_heart_rate_range(access_token, start, start + timedelta(days=1))
+
+
+@cache.cached('sleep-history', ttl=lambda arguments: cache.ttl_for_day(arguments['end']))
 def get_sleep_history(access_token: str, end: datetime = None, duration: int = 30):
     if end is None:
         end = datetime.now()
@@ -55,19 +176,81 @@ def get_sleep_history(access_token: str, end: datetime = None, duration: int = 3
     # Get some data
     endpoint = f'https://api.fitbit.com/1.2/user/-/sleep/date/{start}/{end_string}.json'
     headers = {"Authorization": f"Bearer {access_token}"}
-    return requests.get(endpoint, headers=headers).json()
+    return client.get_json(endpoint, headers=headers)
+
+
+@cache.cached('sleep-range', ttl=ttl_for_range)
+def get_sleep_chunk(access_token: str, start: date, end: date):
+    endpoint = f'https://api.fitbit.com/1.2/user/-/sleep/date/{start.isoformat()}/{end.isoformat()}.json'
+    headers = {"Authorization": f"Bearer {access_token}"}
+    return client.get_json(endpoint, headers=headers)
+
+
+def get_sleep_range(access_token: str, start: date, end: date):
+    # The sleep logs from the start to the end day, any number of years long, in the same shape (and the same newest
+    # first order) as get_sleep_history. Days beyond the default view are backfilled, like the heart rate days.
+    # Returns the logs and whether they cover the whole range
+    chunks, complete = fetch_range(get_sleep_chunk, access_token, start, end, SLEEP_RANGE_DAYS)
+
+    sleeps = dict()
+    for chunk in chunks:
+        for sleep_log in chunk[FITBIT_API_KEY_SLEEP]:
+            if start.isoformat() <= sleep_log[FITBIT_API_KEY_SLEEP_DATE] <= end.isoformat():
+                sleeps[sleep_log[FITBIT_API_KEY_SLEEP_LOG_ID]] = sleep_log
+    sleep_logs = {FITBIT_API_KEY_SLEEP: sorted(sleeps.values(), key=lambda sleep_log: sleep_log[FITBIT_API_KEY_SLEEP_START], reverse=True)}
+    return sleep_logs, complete
+
+
+@cache.cached('sleep-frame', ttl=ttl_for_range)
+def get_sleep_frame(access_token: str, start: date, end: date):
+    # The sleep logs for a range as one table (see helpers.analytics.sleep), built once per range and kept in the cache
+    # once the whole range has been fetched
+    sleep_logs, complete = get_sleep_range(access_token, start, end)
+    sleep_frame = sleep.get_sleep_frame(sleep_logs)
+    return sleep_frame if complete else cache.Partial(sleep_frame)
+
+
+@cache.cached('sleep-periods', ttl=ttl_for_range)
+def get_sleep_periods(access_token: str, start: date, end: date):
+    # Every sleep stage period in a range as one table (see helpers.analytics.sleep), from the same chunks as the sleep
+    # frame and kept in the cache the same way
+    sleep_logs, complete = get_sleep_range(access_token, start, end)
+    sleep_periods = sleep.get_sleep_periods(sleep_logs)
+    return sleep_periods if complete else cache.Partial(sleep_periods)
+
+
+WEIGHT_INTERPOLATION_WINDOW = 30
+
 
 def get_weight(access_token: str, weight_day: datetime):
+    month_before = get_weight_log_before(access_token, weight_day)
+    month_after = get_weight_log_after(access_token, weight_day)
+    return get_weight_from_logs(weight_day, month_before, month_after)
 
-    interpolation_window = 30
 
-    # Get weight for the date specified and the month afterwards
-    weight_day_formatted = datetime.strftime(weight_day, '%Y-%m-%d')
+@cache.cached('weight-log', ttl=lambda arguments: cache.ttl_for_day(arguments['end_day']))
+def get_weight_log(access_token: str, end_day: datetime, days: int = WEIGHT_INTERPOLATION_WINDOW):
+    end_day_formatted = datetime.strftime(end_day, '%Y-%m-%d')
 
-    endpoint = f'https://api.fitbit.com/1/user/-/body/log/weight/date/{weight_day_formatted}/{interpolation_window}d.json'
+    endpoint = f'https://api.fitbit.com/1/user/-/body/log/weight/date/{end_day_formatted}/{days}d.json'
     headers = {"Authorization": f"Bearer {access_token}"}
-    month_before = requests.get(endpoint, headers=headers).json()
+    return client.get_json(endpoint, headers=headers)
+
+
+def get_weight_log_before(access_token: str, weight_day: datetime):
+    # Get weight for the month up to the date specified
+    return get_weight_log(access_token, weight_day)
+
 
+def get_weight_log_after(access_token: str, weight_day: datetime):
+    # Get weight for the month after the date specified
+    return get_weight_log(access_token, weight_day + timedelta(days=WEIGHT_INTERPOLATION_WINDOW))
+
+
+def get_weight_from_logs(weight_day: datetime, month_before, month_after):
+    # Work out the weight on a given day from the weight logs either side of it.
+    # The logs are fetched separately (see get_weight_log_before and get_weight_log_after) so they can be requested
+    # at the same time
     df_before = pd.DataFrame(
         {
             'fat': list(map(lambda w: w.get('fat', None), month_before['weight'])),
@@ -76,12 +259,6 @@ def get_weight(access_token: str, weight_day: datetime):
         index=list(map(lambda w: datetime.strptime(w['date'], '%Y-%m-%d'), month_before['weight']))
     )
 
-    # Get the data for the preceeding month
-    month_before_day_formatted = datetime.strftime(weight_day + timedelta(days=interpolation_window), '%Y-%m-%d')
-    endpoint = f'https://api.fitbit.com/1/user/-/body/log/weight/date/{month_before_day_formatted}/{interpolation_window}d.json'
-    headers = {"Authorization": f"Bearer {access_token}"}
-    month_after = requests.get(endpoint, headers=headers).json()
-
     df_after = pd.DataFrame(
         {
             'fat': list(map(lambda w: w.get('fat', None), month_after['weight'])),
@@ -132,8 +309,16 @@ def get_weight(access_token: str, weight_day: datetime):
         }
 
 
+@cache.cached('devices', ttl=CACHE_TTL_DEVICES)
 def get_device_information(access_token: str):
     # Get some data
     endpoint = 'https://api.fitbit.com/1/user/-/devices.json'
     headers = {"Authorization": f"Bearer {access_token}"}
-    return requests.get(endpoint, headers=headers).json()
\ No newline at end of file
+    devices = client.get_json(endpoint, headers=headers)
+
+    # Anything cached until the next sync is expired by recording the latest sync time
+    sync_times = [d['lastSyncTime'] for d in devices if d.get('lastSyncTime', None) is not None]
+    if len(sync_times) > 0:
+        cache.record_sync(access_token, max(sync_times))
+
+    return devices
\ No newline at end of file
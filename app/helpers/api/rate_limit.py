@@ -0,0 +1,187 @@
+import contextlib
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import helpers.api.cache as cache
+import helpers.common as common
+
+PROVIDER_STRAVA = 'strava'
+PROVIDER_FITBIT = 'fitbit'
+
+# Strava's limits are per application: 100 requests every 15 minutes and 1000 a day (until we see the real values in
+# the response headers). Fitbit's are per user: 150 an hour.
+DEFAULT_LIMITS = {
+    PROVIDER_STRAVA: [100, 1000],
+    PROVIDER_FITBIT: [150],
+}
+
+# How much of each window background work has to leave for interactive requests
+DEFAULT_BACKGROUND_RESERVE = 0.2
+
+# The longest (seconds) a request will be held back waiting for the budget to reset before giving up
+DEFAULT_MAX_WAIT = 10
+DEFAULT_BACKGROUND_MAX_WAIT = 15 * 60
+
+# Retries after a 429 response, with exponential backoff and jitter
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 1
+
+_budgets = dict()
+_condition = threading.Condition()
+_local = threading.local()
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+def get_provider(url: str):
+    host = urlparse(url).hostname or ''
+    if host.endswith('strava.com'):
+        return PROVIDER_STRAVA
+    elif host.endswith('fitbit.com'):
+        return PROVIDER_FITBIT
+    return None
+
+
+def get_user(provider: str, headers: dict):
+    # Strava counts requests against the application, Fitbit against each user
+    if provider == PROVIDER_FITBIT and headers is not None:
+        authorization = headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            return cache.get_owner(authorization[len('Bearer '):])
+    return 'app'
+
+
+def get_window_reset(provider: str, window: int, now: datetime):
+    # When each window's usage goes back to zero (used until the response headers tell us otherwise)
+    if provider == PROVIDER_STRAVA and window == 0:
+        # Every 15 minutes, on the quarter hour (UTC)
+        quarter = now.replace(minute=(now.minute // 15) * 15, second=0, microsecond=0)
+        return (quarter + timedelta(minutes=15)).timestamp()
+    elif provider == PROVIDER_STRAVA:
+        # Midnight UTC
+        return (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+    # Fitbit resets at the top of the hour
+    return (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+
+
+def get_windows(provider: str, user: str):
+    # Must be called holding the condition's lock
+    key = (provider, user)
+    if key not in _budgets:
+        limits = common.get_config_section('rate_limit').get(provider, DEFAULT_LIMITS[provider])
+        _budgets[key] = [{'limit': limit, 'remaining': limit, 'reset': None} for limit in limits]
+
+    now = datetime.now(timezone.utc)
+    for index, window in enumerate(_budgets[key]):
+        if window['reset'] is None or window['reset'] <= now.timestamp():
+            window['remaining'] = window['limit']
+            window['reset'] = get_window_reset(provider, index, now)
+    return _budgets[key]
+
+
+def get_budget(provider: str, user: str = 'app'):
+    # The current budget for a provider and user, so background work can decide whether to carry on.
+    # Returns a list of windows (e.g. Strava's 15 minute and daily limits) with their limit, remaining requests and
+    # the time (epoch seconds) that they reset
+    with _condition:
+        return [dict(window) for window in get_windows(provider, user)]
+
+
+def has_background_budget(provider: str, user: str = 'app'):
+    # Whether background work can make another request without eating into the part of the budget kept for interactive
+    # requests. Background loops check this between requests and stop rather than waiting for the budget to reset
+    reserve_fraction = common.get_config_section('rate_limit').get('background_reserve', DEFAULT_BACKGROUND_RESERVE)
+    return all(window['remaining'] > window['limit'] * reserve_fraction for window in get_budget(provider, user))
+
+
+def is_background():
+    return getattr(_local, 'background', False)
+
+
+@contextlib.contextmanager
+def background():
+    # Requests made inside this block are background work, they leave part of the budget for interactive requests and
+    # wait for it to reset rather than failing
+    previous = is_background()
+    _local.background = True
+    try:
+        yield
+    finally:
+        _local.background = previous
+
+
+def acquire(provider: str, user: str):
+    # Take one request from the budget, waiting for it to reset if it has run out
+    rate_limit_config = common.get_config_section('rate_limit')
+    if is_background():
+        reserve_fraction = rate_limit_config.get('background_reserve', DEFAULT_BACKGROUND_RESERVE)
+        max_wait = rate_limit_config.get('background_max_wait', DEFAULT_BACKGROUND_MAX_WAIT)
+    else:
+        reserve_fraction = 0
+        max_wait = rate_limit_config.get('max_wait', DEFAULT_MAX_WAIT)
+
+    give_up = time.time() + max_wait
+    with _condition:
+        while True:
+            windows = get_windows(provider, user)
+            exhausted = [w for w in windows if w['remaining'] <= w['limit'] * reserve_fraction]
+            if len(exhausted) == 0:
+                for window in windows:
+                    window['remaining'] -= 1
+                return
+
+            wait_until = max(w['reset'] for w in exhausted)
+            if wait_until > give_up:
+                raise RateLimitExceeded(f'{provider} rate limit reached, it resets at {datetime.fromtimestamp(wait_until)}')
+            _condition.wait(wait_until - time.time())
+
+
+def update(provider: str, user: str, response):
+    # Correct our budget from the rate limit headers in a response
+    headers = response.headers
+    with _condition:
+        windows = get_windows(provider, user)
+        if provider == PROVIDER_STRAVA and 'X-RateLimit-Limit' in headers and 'X-RateLimit-Usage' in headers:
+            limits = [int(v) for v in headers['X-RateLimit-Limit'].split(',')]
+            usages = [int(v) for v in headers['X-RateLimit-Usage'].split(',')]
+            for window, limit, usage in zip(windows, limits, usages):
+                window['limit'] = limit
+                window['remaining'] = limit - usage
+        elif provider == PROVIDER_FITBIT and 'Fitbit-Rate-Limit-Remaining' in headers:
+            windows[0]['limit'] = int(headers.get('Fitbit-Rate-Limit-Limit', windows[0]['limit']))
+            windows[0]['remaining'] = int(headers['Fitbit-Rate-Limit-Remaining'])
+            if 'Fitbit-Rate-Limit-Reset' in headers:
+                windows[0]['reset'] = time.time() + int(headers['Fitbit-Rate-Limit-Reset'])
+        _condition.notify_all()
+
+
+def send(request, url: str, headers: dict = None):
+    # Make a request (a function with no arguments) inside the rate limit for the URL's provider, backing off and
+    # retrying if we're told we've sent too many
+    provider = get_provider(url)
+    if provider is None:
+        return request()
+
+    rate_limit_config = common.get_config_section('rate_limit')
+    max_retries = rate_limit_config.get('max_retries', DEFAULT_MAX_RETRIES)
+    backoff = rate_limit_config.get('backoff', DEFAULT_BACKOFF)
+    user = get_user(provider, headers)
+
+    attempt = 0
+    while True:
+        acquire(provider, user)
+        response = request()
+        update(provider, user, response)
+        if response.status_code != 429 or attempt >= max_retries:
+            return response
+
+        # Wait as long as we're told to (if we're told) plus some jitter so retries don't all arrive together
+        retry_after = response.headers.get('Retry-After', None)
+        delay = float(retry_after) if retry_after is not None and retry_after.isdigit() else backoff * 2 ** attempt
+        time.sleep(delay + random.uniform(0, backoff))
+        attempt += 1
@@ -0,0 +1,38 @@
+import threading
+
+_calls = dict()
+_calls_lock = threading.Lock()
+
+
+def do(key: str, function, lock=None):
+    # Make sure only one call for a key is in flight at a time. The first caller runs the function, anyone asking for
+    # the same key while it's running waits for that result instead of making their own call.
+    # The optional lock (a context manager, e.g. a Redis lock) is held while the function runs to do the same thing
+    # across processes. The function should check whether another process has already done the work once it has it.
+    with _calls_lock:
+        call = _calls.get(key, None)
+        leader = call is None
+        if leader:
+            call = {'event': threading.Event(), 'result': None, 'error': None}
+            _calls[key] = call
+
+    if not leader:
+        call['event'].wait()
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+    try:
+        if lock is None:
+            call['result'] = function()
+        else:
+            with lock:
+                call['result'] = function()
+        return call['result']
+    except Exception as e:
+        call['error'] = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call['event'].set()
@@ -1,163 +1,219 @@
-import requests
-import pandas as pd
+import helpers.api.client as client
+import helpers.api.cache as cache
+import helpers.api.single_flight as single_flight
+import helpers.storage.activity_streams as activity_streams
+import helpers.storage.power_curves as power_curves
+import helpers.storage.zone_histograms as zone_histograms
+import helpers.analytics.activity_stream as analytics_stream
+import helpers.analytics.alignment as alignment
+from helpers.analytics.activity_stream import ActivityStream
+import helpers.analytics.power_curve as power_curve
+import helpers.analytics.power_summary as power_summary
+import helpers.analytics.splits as splits
+import helpers.analytics.gradient as gradient
+import helpers.analytics.zones as zones
+import helpers.common as common
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from helpers.constants import *
 
+DEFAULT_POWER_SPLIT_LEVELS = 4
 
-def get_strava_activities(access_token: str):
+
+def get_strava_activities(access_token: str, page: int = 1, per_page: int = 30, after: datetime = None, before: datetime = None):
+    # Get a page of the athlete's activities, optionally only those after and/or before a given (UTC) time.
+    # These aren't cached, the activity index (see helpers/sync/strava_activities.py) keeps them instead
     endpoint = 'https://www.strava.com/api/v3/athlete/activities'
     headers = {'Authorization': f'Bearer {access_token}'}
-    return requests.get(endpoint, headers=headers).json()
+    params = {'page': page, 'per_page': per_page}
+    if after is not None:
+        params['after'] = int(after.replace(tzinfo=timezone.utc).timestamp())
+    if before is not None:
+        params['before'] = int(before.replace(tzinfo=timezone.utc).timestamp())
+    return client.get_json(endpoint, headers=headers, params=params)
 
 
 def get_strava_activity_stream(access_token: str, activity_id: str):
-    endpoint = f'https://www.strava.com/api/v3/activities/{activity_id}/streams?keys=watts,heartrate,time,distance,altitude,grade_smooth'
-    headers = {'Authorization': f'Bearer {access_token}'}
-    return requests.get(endpoint, headers=headers).json()
+    # A finished activity's stream never changes so it is only ever downloaded once, after that it's read from disk.
+    # Returns a dictionary of stream type (e.g. watts) to array
+    if not activity_streams.has_stream(activity_id):
+        key = f'strava-activity-stream:{activity_id}'
+        single_flight.do(key, lambda: download_strava_activity_stream(access_token, activity_id), cache.get_backend().lock_key(key))
+    return activity_streams.load_stream(activity_id)
+
+
+def download_strava_activity_stream(access_token: str, activity_id: str):
+    # Another thread or process may have stored the stream while we waited for the lock
+    if not activity_streams.has_stream(activity_id):
+        endpoint = f'https://www.strava.com/api/v3/activities/{activity_id}/streams?keys=watts,heartrate,time,distance,altitude,grade_smooth'
+        headers = {'Authorization': f'Bearer {access_token}'}
+        activity_streams.save_stream(activity_id, client.get_json(endpoint, headers=headers))
 
 
+@cache.cached('strava-activity', ttl=CACHE_TTL_STRAVA_ACTIVITY)
 def get_strava_activity(access_token: str, activity_id: str):
     endpoint = f'https://www.strava.com/api/v3/activities/{activity_id}'
     headers = {'Authorization': f'Bearer {access_token}'}
-    return requests.get(endpoint, headers=headers).json()
+    return client.get_json(endpoint, headers=headers)
 
 
+@cache.cached('strava-athlete', ttl=CACHE_TTL_STRAVA_ATHLETE)
 def get_strava_athlete(access_token: str):
     endpoint = 'https://www.strava.com/api/v3/athlete'
     headers = {'Authorization': f'Bearer {access_token}'}
-    return requests.get(endpoint, headers=headers).json()
-
-
-def get_cycling_data_frame(cycling_activity_stream):
-    time = list(filter(lambda f: f['type'] == 'time', cycling_activity_stream))
-    power = list(filter(lambda f: f['type'] == 'watts', cycling_activity_stream))
-    hr = list(filter(lambda f: f['type'] == 'heartrate', cycling_activity_stream))
-    distance = list(filter(lambda f: f['type'] == 'distance', cycling_activity_stream))
-    altitude = list(filter(lambda f: f['type'] == 'altitude', cycling_activity_stream))
-    grade = list(filter(lambda f: f['type'] == 'grade_smooth', cycling_activity_stream))
-    empty = [None] * len(time[0]['data'])
-
-    data = {
-        'time': time[0]['data'] if len(time) > 0 else empty,
-        'power': power[0]['data'] if len(power) > 0 else empty,
-        'hr': hr[0]['data'] if len(hr) > 0 else empty,
-        'distance': distance[0]['data'] if len(distance) > 0 else empty,
-        'altitude': altitude[0]['data'] if len(altitude) > 0 else empty,
-        'grade': grade[0]['data'] if len(grade) > 0 else empty
-    }
-
-    headers = ['time', 'power', 'hr', 'distance', 'altitude', 'grade']
-
-    df = pd.DataFrame(data, columns=headers)
-
-    return df
-
-
-def get_cycling_power_summary(cycling_activity_stream, ftp):
-    # See this article for the maths:
-    # https://medium.com/critical-powers/formulas-from-training-and-racing-with-a-power-meter-2a295c661b46
-
-    df = get_cycling_data_frame(cycling_activity_stream)
-
-    # Get the time for each row in the dataframe
-    # TODO Assume 1 second for now
-    time_interval = 1
-
-    thirty_second_row_count = int(30 / time_interval)
-
-    df['thirty'] = df.power.rolling(window=thirty_second_row_count).mean()
-    df['pow4'] = df['thirty']**4
-
-    max_pow = df['pow4'].mean()
-    normalised_power = max_pow**0.25
-    intensity_factor = normalised_power / ftp
-    duration_seconds = df['time'].max()
-    tss = (duration_seconds * normalised_power * intensity_factor) / (ftp * 36)
-
-    return {
-        'normalised_power': normalised_power,
-        'intensity_factor': intensity_factor,
-        'tss': tss,
-    }
-
-def get_cycling_activity_power_stats(cycling_activity_stream):
-    df = get_cycling_data_frame(cycling_activity_stream)
-
-    # Get the time for each row in the dataframe
-    # TODO Assume 1 second for now
-    time_interval = 1
-
-    twenty_minute_row_count = int((20 * 60) / time_interval)
-    ten_minute_row_count = int((10 * 60) / time_interval)
-    five_minute_row_count = int((5 * 60) / time_interval)
-    one_minute_row_count = int(60 / time_interval)
-    thirty_second_row_count = int(30 / time_interval)
-    five_second_row_count = int(5 / time_interval)
-    one_second_row_count = int(1 / time_interval)
-
-    return {
-        'twenty_minute': df.power.rolling(window=twenty_minute_row_count).mean().max(),
-        'ten_minute': df.power.rolling(window=ten_minute_row_count).mean().max(),
-        'five_minute': df.power.rolling(window=five_minute_row_count).mean().max(),
-        'one_minute': df.power.rolling(window=one_minute_row_count).mean().max(),
-        'thirty_second': df.power.rolling(window=thirty_second_row_count).mean().max(),
-        'five_second': df.power.rolling(window=five_second_row_count).mean().max(),
-        'one_second': df.power.rolling(window=one_second_row_count).mean().max(),
-    }
-
-
-def get_cycling_power_splits(cycling_activity_stream, levels=4):
-    df = get_cycling_data_frame(cycling_activity_stream)
-    output = list()
-
-    split_count = 1
-    for level in range(levels):
-        splits = get_cycling_power_split(df, split_count)
-        output.append({
-            'split_count': split_count,
-            'splits': splits
-        })
-        split_count = split_count * 2
+    return client.get_json(endpoint, headers=headers)
+
+
+def get_activity_stream(access_token: str, activity_id: str):
+    # Get the parsed stream for an activity, it's only built once per activity and then shared by everything that
+    # needs it
+    return analytics_stream.memoized(
+        activity_id,
+        lambda: analytics_stream.from_columns(activity_id, get_strava_activity_stream(access_token, activity_id))
+    )
+
+
+def get_cycling_power_state(activity_stream: ActivityStream):
+    # The FTP independent part of the power summary, worked out once per activity and kept in the cache so the FTP
+    # callback doesn't need the stream at all
+    name = f'power-state:{activity_stream.activity_id}'
+    state = cache.get_object(name)
+    if state is None:
+        state = power_summary.get_power_state(activity_stream.power, activity_stream.time.max() if len(activity_stream) > 0 else 0)
+        cache.set_object(name, state, CACHE_TTL_POWER_STATE)
+    return state
+
+
+def get_heart_rate_offset(activity_stream: ActivityStream, heart_rate, activity_start: datetime, heart_rate_complete: bool):
+    # How many seconds the activity's heart rate is behind the Fitbit heart rate (a frame with a row per second), as
+    # the two devices' clocks are rarely quite the same. None if there isn't enough heart rate in both to go on (e.g.
+    # the watch hasn't synced yet). It's only kept in the cache once the Fitbit heart rate for the activity is complete,
+    # until then the watch may have synced only part of the ride and the offset could change, so it's worked out again
+    # each time. The offset is only applied if the heart rates match well enough once shifted
+    alignment_config = common.get_config_section('alignment')
+    name = f'heart-rate-offset:{activity_stream.activity_id}'
+    offset = cache.get_object(name)
+    if offset is None and len(heart_rate) > 0:
+        start = int((np.datetime64(activity_start, 's') - heart_rate.index.values[0].astype('datetime64[s]')) // np.timedelta64(1, 's'))
+        has_heartrate = activity_stream.heartrate > 0
+        offset = alignment.get_offset(
+            heart_rate['hr'].values,
+            start,
+            activity_stream.time[has_heartrate],
+            activity_stream.heartrate[has_heartrate],
+            alignment_config.get('max_lag', alignment.DEFAULT_MAX_LAG),
+            alignment_config.get('min_overlap', alignment.DEFAULT_MIN_OVERLAP)
+        )
+        if offset is not None and heart_rate_complete:
+            cache.set_object(name, offset, CACHE_TTL_HEART_RATE_OFFSET)
+
+    if offset is not None:
+        offset['applied'] = offset['confidence'] >= alignment_config.get('min_confidence', alignment.DEFAULT_MIN_CONFIDENCE)
+    return offset
+
+
+def get_cycling_power_summary(power_state, ftp):
+    return power_summary.get_power_summary(power_state, ftp)
+
+
+def get_cycling_power_curve(activity_stream: ActivityStream, activity=None):
+    # The best average power for every duration from one second to the length of the ride.
+    # Given the activity's summary, the curve is kept in the power curve store the first time it's worked out so the
+    # best curves across all rides never need the streams
+    if activity is not None:
+        stored = power_curves.get_curve(activity[STRAVA_API_KEY_ACTIVITY_ID])
+        if stored is not None:
+            return {'durations': power_curve.DURATIONS, 'power': stored}
+
+    curve = power_curve.get_power_curve(activity_stream.power)
+    if activity is not None:
+        power_curves.save_curve(
+            activity[STRAVA_API_KEY_ACTIVITY_ID],
+            activity[STRAVA_API_KEY_ACTIVITY_ATHLETE]['id'],
+            datetime.strptime(activity[STRAVA_API_KEY_ACTIVITY_START_LOCAL], UTC_DATE_FORMAT),
+            curve['power']
+        )
+    return curve
+
+
+def get_activity_power_state(access_token: str, activity_id):
+    # The power state from the cache, the stream is only read if it has been dropped
+    state = cache.get_object(f'power-state:{activity_id}')
+    if state is None:
+        state = get_cycling_power_state(get_activity_stream(access_token, activity_id))
+    return state
+
+
+def get_cycling_zones(access_token: str, activity, ftp):
+    # The time in each power and heart rate zone for a ride. Power zones come from the cached power state (so they match
+    # the power summary and any FTP is just arithmetic), heart rate zones are stored per activity and set of zones so
+    # the stream is only read the first time. Only histograms for the athlete's own FTP are stored, for the weekly zones
+    activity_id = activity[STRAVA_API_KEY_ACTIVITY_ID]
+    athlete_ftp = get_strava_athlete(access_token).get('ftp', None)
+    output = dict()
+    for kind, zone_list, threshold in zones.get_zone_definitions(ftp):
+        definition = zones.get_definition(kind, zone_list, threshold)
+        seconds = zone_histograms.get_histogram(activity_id, definition)
+        if seconds is None:
+            if kind == zones.ZONES_POWER:
+                seconds = power_summary.get_zone_seconds(get_activity_power_state(access_token, activity_id)['cumulative_histogram'], threshold)
+            else:
+                seconds = zones.get_activity_zone_seconds(get_activity_stream(access_token, activity_id), kind, zone_list, threshold)
+            if kind != zones.ZONES_POWER or (athlete_ftp and float(athlete_ftp) == threshold):
+                zone_histograms.save_histograms([(
+                    activity_id,
+                    definition,
+                    activity[STRAVA_API_KEY_ACTIVITY_ATHLETE]['id'],
+                    datetime.strptime(activity[STRAVA_API_KEY_ACTIVITY_START_LOCAL], UTC_DATE_FORMAT),
+                    seconds
+                )])
+        output[kind] = {'zones': [name for name, _ in zone_list], 'seconds': seconds}
     return output
 
 
-def get_cycling_power_split(df, split_count):
-    splits = np.array_split(df, split_count)
-
-    return list(map(lambda d: d['power'].mean() if not np.isnan(d['power'].mean()) else None, splits))
-
-
-def get_cycling_gradient_splits(cycling_activity_stream, rolling_window=10):
-    df = get_cycling_data_frame(cycling_activity_stream)
+def get_best_power_curves(athlete_id: int, today: datetime = None):
+    # The best power curves of all time, this season and the last 90 days from the power curve store.
+    # All time and season bests are kept up to date as rides are stored, rides drop out of the last 90 days so that one
+    # is merged from the stored curves (a few hundred rows at most)
+    today = today or datetime.now()
+    today = datetime(today.year, today.month, today.day)
+    rolling = power_curves.get_curves(athlete_id, today - timedelta(days=BEST_POWER_CURVE_ROLLING_DAYS - 1), today + timedelta(days=1))
+
+    output = dict()
+    for name, curve in [
+        ('All time', power_curves.get_best(athlete_id, power_curves.PERIOD_ALL_TIME)),
+        (f'{today.year} season', power_curves.get_best(athlete_id, power_curves.get_season(today))),
+        (f'Last {BEST_POWER_CURVE_ROLLING_DAYS} days', power_curve.merge_power_curves(rolling) if len(rolling) > 0 else None),
+    ]:
+        if curve is not None:
+            output[name] = {'durations': power_curve.DURATIONS, 'power': curve}
+    return output
 
-    # Get the median gradient over a rolling window (an attempt to smooth things out a bit)
-    df['grade_rolling'] = df['grade'].rolling(window=rolling_window).median()
 
-    # Round the gradients to the nearest integer to group things together
-    df['grade_round'] = df['grade_rolling'].round()
+def get_cycling_activity_power_stats(cycling_power_curve):
+    # The best average power for the standard durations (e.g. twenty minutes), read from the power curve
+    return {name: power_curve.get_power_at(cycling_power_curve, duration) for name, duration in power_curve.STANDARD_DURATIONS.items()}
 
-    # Group by the rounded gradient and perform some aggregations
-    mean = df.groupby('grade_round').mean()
-    max = df.groupby('grade_round').max()
-    count = df.groupby('grade_round').count()
 
-    # Re-index to add any missing gradients
-    new_index = pd.Index(np.arange(df['grade_round'].min(), df['grade_round'].max(), 1), name='grade_index')
-    mean_reindexed = mean.reindex(new_index)
-    max_reindexed = max.reindex(new_index)
-    count_reindexed = count.reindex(new_index)
+def get_cycling_power_splits(activity_stream: ActivityStream, levels=None):
+    # The average power for the ride split in 1, 2, 4, 8... parts. All the levels come from one cumulative sum of power
+    if levels is None:
+        levels = common.get_config_section('analytics').get('power_split_levels', DEFAULT_POWER_SPLIT_LEVELS)
+    return splits.get_split_means(activity_stream.power, [2 ** level for level in range(levels)])
 
-    # Add suffixes to the column names to ensure they're all different (needed before we concatenate them all together)
-    mean_reindexed = mean_reindexed.add_suffix('_mean')
-    max_reindexed = max_reindexed.add_suffix('_max')
-    count_reindexed = count_reindexed.add_suffix('_count')
 
-    # Get the time for each row in the dataframe
-    # TODO Assume 1 second for now
-    time_interval = 1
+def get_cycling_time_splits(activity_stream: ActivityStream, split_seconds: int):
+    # The average power for every block of time (e.g. every 5 minutes)
+    return splits.get_time_split_means(activity_stream.power, activity_stream.time, split_seconds)
 
-    # Add a duration column
-    count_reindexed['duration'] = count_reindexed.apply(lambda row: pd.Timedelta(seconds=0) if np.isnan(row['time_count']) else pd.Timedelta(seconds=row['time_count'] / time_interval), axis=1)
 
-    # Concatenate the different aggregates together and pick out the meaningful columns
-    return pd.concat([mean_reindexed, max_reindexed, count_reindexed], axis=1, join='inner').filter(['power_mean', 'power_max', 'hr_mean', 'hr_max', 'duration'])
+def get_cycling_gradient_splits(activity_stream: ActivityStream, bucket_width=None, smoothing_window=None):
+    # Time, power and heart rate for each gradient bucket, as columns
+    gradient_config = common.get_config_section('analytics').get('gradient', None) or {}
+    return gradient.get_gradient_buckets(
+        activity_stream.grade,
+        activity_stream.power,
+        activity_stream.heartrate,
+        bucket_width=bucket_width or gradient_config.get('bucket_width', gradient.DEFAULT_BUCKET_WIDTH),
+        smoothing_window=smoothing_window or gradient_config.get('smoothing_window', gradient.DEFAULT_SMOOTHING_WINDOW)
+    )
@@ -2,12 +2,13 @@ from flask import Flask, session
 import yaml
 import json
 import base64
-import requests
+import helpers.api.client as client
 import redis
 from datetime import datetime, timedelta
 
 from helpers.constants import *
 import helpers.common as common
+import helpers.api.cache as cache
 
 
 def parse_query_for_access_token(query):
@@ -33,7 +34,7 @@ def parse_query_for_access_token(query):
     # Store the time we made the request so we know how long the access token will last for
     request_date = datetime.now()
 
-    output = json.loads(requests.post(endpoint, data=data, headers=headers).text)
+    output = json.loads(client.post(endpoint, data=data, headers=headers).text)
 
     # A successful call returns the following data:
     # - access_token
@@ -45,6 +46,8 @@ def parse_query_for_access_token(query):
         session[SESSION_FITBIT_ACCESS_TOKEN_KEY] = output['access_token']
         session[SESSION_FITBIT_REFRESH_TOKEN_KEY] = output['refresh_token']
         session[SESSION_FITBIT_EXPIRES_KEY] = request_date + timedelta(seconds=output['expires_in'])
+        session[SESSION_FITBIT_USER_ID_KEY] = output['user_id']
+        register_cache_owner()
 
         # Access token saved to session for subsequent calls - success
         return True
@@ -72,7 +75,7 @@ def refresh_access_token():
         # Store the time we made the request so we know how long the access token will last for
         request_date = datetime.now()
 
-        output = json.loads(requests.post(endpoint, data=data, headers=headers).text)
+        output = json.loads(client.post(endpoint, data=data, headers=headers).text)
 
         if 'access_token' in output:
             session[SESSION_FITBIT_ACCESS_TOKEN_KEY] = output['access_token']
@@ -91,8 +94,17 @@ def has_valid_access_token():
 
 def ensure_valid_access_token():
     # Checks whether we have a valid access token, refreshes it if not
+    if not has_valid_access_token():
+        refresh_access_token()
     if has_valid_access_token():
+        register_cache_owner()
         return True
-    else:
-        refresh_access_token()
-        return has_valid_access_token()
+    return False
+
+
+def register_cache_owner():
+    # Tell the API cache which athlete the current access token belongs to so cached data outlives the token
+    owner_id = session.get(SESSION_FITBIT_USER_ID_KEY, None)
+    if owner_id is not None:
+        expires_in = (session.get(SESSION_FITBIT_EXPIRES_KEY) - datetime.now()).total_seconds()
+        cache.register_owner(session.get(SESSION_FITBIT_ACCESS_TOKEN_KEY), f'fitbit-{owner_id}', expires_in)
@@ -2,12 +2,14 @@ from flask import Flask, session
 import yaml
 import json
 import base64
-import requests
+import helpers.api.client as client
 import redis
 from datetime import datetime, timedelta
 
 from helpers.constants import *
 import helpers.common as common
+import helpers.api.cache as cache
+import helpers.api.strava as api_strava
 
 
 def parse_query_for_access_token(query):
@@ -27,12 +29,14 @@ def parse_query_for_access_token(query):
     # Store the time we made the request so we know how long the access token will last for
     request_date = datetime.now()
 
-    output = json.loads(requests.post(endpoint, data=data, headers=headers).text)
+    output = json.loads(client.post(endpoint, data=data, headers=headers).text)
 
     if 'access_token' in output:
         session[SESSION_STRAVA_ACCESS_TOKEN_KEY] = output['access_token']
         session[SESSION_STRAVA_REFRESH_TOKEN_KEY] = output['refresh_token']
         session[SESSION_STRAVA_EXPIRES_KEY] = request_date + timedelta(seconds=output['expires_in'])
+        session[SESSION_STRAVA_ATHLETE_ID_KEY] = output['athlete']['id']
+        register_cache_owner()
 
         # Access token saved to session for subsequent calls - success
         return True
@@ -57,7 +61,7 @@ def refresh_access_token():
         # Store the time we made the request so we know how long the access token will last for
         request_date = datetime.now()
 
-        output = json.loads(requests.post(endpoint, data=data, headers=headers).text)
+        output = json.loads(client.post(endpoint, data=data, headers=headers).text)
 
         if 'access_token' in output:
             session[SESSION_STRAVA_ACCESS_TOKEN_KEY] = output['access_token']
@@ -76,8 +80,27 @@ def has_valid_access_token():
 
 def ensure_valid_access_token():
     # Checks whether we have a valid access token, refreshes it if not
+    if not has_valid_access_token():
+        refresh_access_token()
     if has_valid_access_token():
+        register_cache_owner()
         return True
-    else:
-        refresh_access_token()
-        return has_valid_access_token()
+    return False
+
+
+def register_cache_owner():
+    # Tell the API cache which athlete the current access token belongs to so cached data outlives the token
+    owner_id = session.get(SESSION_STRAVA_ATHLETE_ID_KEY, None)
+    if owner_id is not None:
+        expires_in = (session.get(SESSION_STRAVA_EXPIRES_KEY) - datetime.now()).total_seconds()
+        cache.register_owner(session.get(SESSION_STRAVA_ACCESS_TOKEN_KEY), f'strava-{owner_id}', expires_in)
+
+
+def get_athlete_id():
+    # The athlete ID is saved when we authenticate, sessions from before that was added have to look it up
+    athlete_id = session.get(SESSION_STRAVA_ATHLETE_ID_KEY, None)
+    if athlete_id is None:
+        athlete_id = api_strava.get_strava_athlete(session.get(SESSION_STRAVA_ACCESS_TOKEN_KEY, None))['id']
+        session[SESSION_STRAVA_ATHLETE_ID_KEY] = athlete_id
+        register_cache_owner()
+    return athlete_id
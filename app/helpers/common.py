@@ -1,4 +1,6 @@
 import urllib.parse as urlparse
+import yaml
+from functools import lru_cache
 from urllib.parse import parse_qs
 
 
@@ -9,3 +11,20 @@ def get_parameter(query, param):
         return parse_qs(parsed.query)[param]
     except KeyError:
         return None
+
+
+@lru_cache(maxsize=None)
+def get_config():
+    # Load the config once per process, the helpers read it on every request otherwise
+    with open('config.yml') as config_file:
+        return yaml.safe_load(config_file)
+
+
+def get_config_section(section):
+    # Get a section of the config, empty if it hasn't been set
+    return get_config().get(section, None) or {}
+
+
+def get_storage_path():
+    # Where the local stores (streams, activity index etc.) are kept
+    return get_config_section('storage').get('path', 'data')
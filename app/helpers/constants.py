@@ -5,7 +5,9 @@ SESSION_FITBIT_EXPIRES_KEY = 'fitbit_expires'
 SESSION_STRAVA_ACCESS_TOKEN_KEY = 'strava_access_token'
 SESSION_STRAVA_REFRESH_TOKEN_KEY = 'strava_refresh_token'
 SESSION_STRAVA_EXPIRES_KEY = 'strava_expires'
-SESSION_STRAVA_ACTIVITY_STREAMS_KEY = 'activitity-streams'
+
+SESSION_FITBIT_USER_ID_KEY = 'fitbit_user_id'
+SESSION_STRAVA_ATHLETE_ID_KEY = 'strava_athlete_id'
 
 # URL endpoints
 URL_CYCLING = '/cycling'
@@ -19,7 +21,6 @@ URL_BASE = '/'
 DISPLAY_DATE_FORMAT = '%A %d %B %Y %H:%M'
 UTC_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 FITBIT_LOCAL_TIME = '%Y-%m-%dT%H:%M:%S.%f'
-GANTT_CHART_TIME = '%Y-%m-%d %H:%M:%S'
 DATE_ONLY = '%Y-%m-%d'
 
 # Colours
@@ -46,6 +47,17 @@ FITBIT_API_KEY_SLEEP_WAKE = 'wake'
 FITBIT_API_KEY_SLEEP_AWAKE = 'awake'
 FITBIT_API_KEY_SLEEP_ASLEEP = 'asleep'
 FITBIT_API_KEY_SLEEP_RESTLESS = 'restless'
+FITBIT_API_KEY_SLEEP_DURATION = 'duration'
+FITBIT_API_KEY_SLEEP_EFFICIENCY = 'efficiency'
+FITBIT_API_KEY_SLEEP_START = 'startTime'
+FITBIT_API_KEY_SLEEP_TYPE = 'type'
+FITBIT_API_KEY_SLEEP_LOG_ID = 'logId'
+FITBIT_API_KEY_SLEEP_MAIN = 'isMainSleep'
+FITBIT_API_KEY_SLEEP_DATA = 'data'
+FITBIT_API_KEY_SLEEP_DATE_TIME = 'dateTime'
+FITBIT_API_KEY_SLEEP_SECONDS = 'seconds'
+FITBIT_API_KEY_SLEEP_LEVEL = 'level'
+FITBIT_SLEEP_TYPE_CLASSIC = 'classic'
 FITBIT_API_KEY_HR_ACTIVITY = 'activities-heart'
 FITBIT_API_KEY_HR_INTRADAY = 'activities-heart-intraday'
 FITBIT_API_KEY_INTRADAY_DATASET = 'dataset'
@@ -60,10 +72,14 @@ STRAVA_API_KEY_ACTIVITY_NAME = 'name'
 STRAVA_API_KEY_ACTIVITY_DESCRIPTION = 'description'
 STRAVA_API_KEY_ACTIVITY_START_LOCAL = 'start_date_local'
 STRAVA_API_KEY_ACTIVITY_START = 'start_date'
+STRAVA_API_KEY_ACTIVITY_ATHLETE = 'athlete'
 STRAVA_API_KEY_DATA_STREAM_TYPE = 'type'
 STRAVA_API_KEY_DATA_STREAM_TIME = 'time'
 STRAVA_API_KEY_DATA_STREAM_POWER = 'watts'
 STRAVA_API_KEY_DATA_STREAM_HEARTRATE = 'heartrate'
+STRAVA_API_KEY_DATA_STREAM_DISTANCE = 'distance'
+STRAVA_API_KEY_DATA_STREAM_ALTITUDE = 'altitude'
+STRAVA_API_KEY_DATA_STREAM_GRADE = 'grade_smooth'
 STRAVA_API_KEY_DATA_STREAM_DATA = 'data'
 STRAVA_API_KEY_ELAPSED_TIME = 'elapsed_time'
 STRAVA_API_KEY_MOVING_TIME = 'moving_time'
@@ -100,5 +116,46 @@ TITLE_SUFFER_SCORE = 'Suffer score'
 TITLE_DISTANCE = 'Distance'
 TITLE_PAGE = 'Phil Garner fitness dashboard'
 
+# Power zones (Coggan) as the name and the upper limit as a fraction of FTP, the last zone has no upper limit
+POWER_ZONES = [
+    ('Active recovery', 0.55),
+    ('Endurance', 0.75),
+    ('Tempo', 0.90),
+    ('Lactate threshold', 1.05),
+    ('VO2 max', 1.20),
+    ('Anaerobic capacity', 1.50),
+    ('Neuromuscular power', None),
+]
+
+# Heart rate zones as the name and the upper limit as a fraction of maximum heart rate
+HEART_RATE_ZONES_MAX = [
+    ('Very light', 0.60),
+    ('Light', 0.70),
+    ('Moderate', 0.80),
+    ('Hard', 0.90),
+    ('Maximum', None),
+]
+
+# Heart rate zones (Friel) as the name and the upper limit as a fraction of lactate threshold heart rate
+HEART_RATE_ZONES_THRESHOLD = [
+    ('Recovery', 0.81),
+    ('Aerobic', 0.90),
+    ('Tempo', 0.94),
+    ('Sub-threshold', 1.00),
+    ('Super-threshold', 1.03),
+    ('Aerobic capacity', 1.06),
+    ('Anaerobic capacity', None),
+]
+
+# The number of days (including today) in the rolling best power curve
+BEST_POWER_CURVE_ROLLING_DAYS = 90
+
+# Cache TTLs (seconds)
+CACHE_TTL_DEVICES = 5 * 60
+CACHE_TTL_STRAVA_ACTIVITY = 60 * 60
+CACHE_TTL_STRAVA_ATHLETE = 60 * 60
+CACHE_TTL_POWER_STATE = 7 * 24 * 60 * 60
+CACHE_TTL_HEART_RATE_OFFSET = 7 * 24 * 60 * 60
+
 # Placeholders
 EMPTY_PLACEHOLDER = '--'
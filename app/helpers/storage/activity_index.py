@@ -0,0 +1,109 @@
+import json
+import time
+from datetime import datetime
+
+import helpers.storage.database as database
+from helpers.constants import *
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS activities (
+        id INTEGER PRIMARY KEY,
+        athlete_id INTEGER NOT NULL,
+        start_date TEXT NOT NULL,
+        start_date_local TEXT NOT NULL,
+        type TEXT NOT NULL,
+        summary TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS activities_start_date ON activities (athlete_id, start_date_local)',
+    'CREATE INDEX IF NOT EXISTS activities_type ON activities (athlete_id, type, start_date_local)',
+    '''CREATE TABLE IF NOT EXISTS activity_sync (
+        athlete_id INTEGER PRIMARY KEY,
+        backfilled INTEGER NOT NULL,
+        last_sync REAL NOT NULL
+    )''',
+]
+
+
+def get_connection():
+    database.ensure_schema('activity_index', SCHEMA)
+    return database.get_connection()
+
+
+def save_activities(athlete_id: int, activities: list):
+    # Insert or update the summaries of some activities (as returned by the Strava activities endpoint)
+    connection = get_connection()
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO activities (id, athlete_id, start_date, start_date_local, type, summary) VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (
+                    a[STRAVA_API_KEY_ACTIVITY_ID],
+                    athlete_id,
+                    a[STRAVA_API_KEY_ACTIVITY_START],
+                    a[STRAVA_API_KEY_ACTIVITY_START_LOCAL],
+                    a[STRAVA_API_KEY_DATA_STREAM_TYPE],
+                    json.dumps(a)
+                )
+                for a in activities
+            ]
+        )
+
+
+def get_activities(athlete_id: int, start: datetime = None, end: datetime = None, types: list = None, limit: int = None):
+    # Get the activities for an athlete, newest first (the same order Strava uses), at most the limit if there is one.
+    # Start and end are local times, the end is exclusive
+    query = 'SELECT summary FROM activities WHERE athlete_id = ?'
+    parameters = [athlete_id]
+    if start is not None:
+        query += ' AND start_date_local >= ?'
+        parameters.append(start.strftime(UTC_DATE_FORMAT))
+    if end is not None:
+        query += ' AND start_date_local < ?'
+        parameters.append(end.strftime(UTC_DATE_FORMAT))
+    if types is not None:
+        query += f' AND type IN ({", ".join("?" * len(types))})'
+        parameters.extend(types)
+    query += ' ORDER BY start_date_local DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        parameters.append(limit)
+
+    return [json.loads(row['summary']) for row in get_connection().execute(query, parameters)]
+
+
+def get_newest_start(athlete_id: int):
+    # The UTC start time of the newest activity stored for the athlete, None if there aren't any
+    row = get_connection().execute('SELECT MAX(start_date) AS newest FROM activities WHERE athlete_id = ?', [athlete_id]).fetchone()
+    return datetime.strptime(row['newest'], UTC_DATE_FORMAT) if row['newest'] is not None else None
+
+
+def get_oldest_start(athlete_id: int):
+    # The UTC start time of the oldest activity stored for the athlete, None if there aren't any
+    row = get_connection().execute('SELECT MIN(start_date) AS oldest FROM activities WHERE athlete_id = ?', [athlete_id]).fetchone()
+    return datetime.strptime(row['oldest'], UTC_DATE_FORMAT) if row['oldest'] is not None else None
+
+
+def get_sync_state(athlete_id: int):
+    row = get_connection().execute('SELECT backfilled, last_sync FROM activity_sync WHERE athlete_id = ?', [athlete_id]).fetchone()
+    if row is None:
+        return {'backfilled': False, 'last_sync': None}
+    return {'backfilled': bool(row['backfilled']), 'last_sync': row['last_sync']}
+
+
+def record_sync(athlete_id: int):
+    # Record that the athlete's new activities have just been synced, leaving whether their history has been backfilled
+    # as it is
+    connection = get_connection()
+    with connection:
+        connection.execute(
+            '''INSERT INTO activity_sync (athlete_id, backfilled, last_sync) VALUES (?, 0, ?)
+            ON CONFLICT (athlete_id) DO UPDATE SET last_sync = excluded.last_sync''',
+            [athlete_id, time.time()]
+        )
+
+
+def set_backfilled(athlete_id: int):
+    # Record that the athlete's whole history has been synced
+    connection = get_connection()
+    with connection:
+        connection.execute('UPDATE activity_sync SET backfilled = 1 WHERE athlete_id = ?', [athlete_id])
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+import helpers.common as common
+from helpers.constants import *
+
+# The types the columns are stored as. Time is always whole seconds, everything else may have gaps (stored as NaN).
+STREAM_COLUMN_TYPES = {
+    STRAVA_API_KEY_DATA_STREAM_TIME: np.int32,
+    STRAVA_API_KEY_DATA_STREAM_POWER: np.float32,
+    STRAVA_API_KEY_DATA_STREAM_HEARTRATE: np.float32,
+    STRAVA_API_KEY_DATA_STREAM_DISTANCE: np.float32,
+    STRAVA_API_KEY_DATA_STREAM_ALTITUDE: np.float32,
+    STRAVA_API_KEY_DATA_STREAM_GRADE: np.float32,
+}
+
+
+def get_stream_path(activity_id):
+    return os.path.join(common.get_storage_path(), 'streams', str(activity_id))
+
+
+def has_stream(activity_id):
+    return os.path.isdir(get_stream_path(activity_id))
+
+
+def save_stream(activity_id, cycling_activity_stream):
+    # Store the decoded columns of a Strava stream, one .npy file per column.
+    # The files are written to a temporary directory first and moved into place so readers never see a partial stream
+    streams_path = os.path.join(common.get_storage_path(), 'streams')
+    os.makedirs(streams_path, exist_ok=True)
+    temporary_path = tempfile.mkdtemp(dir=streams_path, prefix='.tmp-')
+
+    try:
+        for stream in cycling_activity_stream:
+            stream_type = stream[STRAVA_API_KEY_DATA_STREAM_TYPE]
+            if stream_type in STREAM_COLUMN_TYPES:
+                data = np.array(stream[STRAVA_API_KEY_DATA_STREAM_DATA], dtype=np.float64)
+                if STREAM_COLUMN_TYPES[stream_type] == np.int32:
+                    data = np.nan_to_num(data)
+                np.save(os.path.join(temporary_path, f'{stream_type}.npy'), data.astype(STREAM_COLUMN_TYPES[stream_type]))
+        os.replace(temporary_path, get_stream_path(activity_id))
+    except OSError:
+        # Another request stored the stream first, theirs is just as good
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        if not has_stream(activity_id):
+            raise
+
+
+def load_stream(activity_id):
+    # Load the columns of a stored stream as a dictionary of stream type to memory-mapped array.
+    # Returns None if the stream hasn't been stored
+    path = get_stream_path(activity_id)
+    if not os.path.isdir(path):
+        return None
+
+    columns = dict()
+    for file_name in os.listdir(path):
+        stream_type, extension = os.path.splitext(file_name)
+        if extension == '.npy':
+            columns[stream_type] = np.load(os.path.join(path, file_name), mmap_mode='r')
+    return columns
@@ -0,0 +1,39 @@
+import os
+import sqlite3
+import threading
+
+import helpers.common as common
+
+DATABASE_FILE_NAME = 'fitness.db'
+
+_local = threading.local()
+_created_schemas = set()
+_schema_lock = threading.Lock()
+
+
+def get_connection():
+    # One connection per thread, SQLite connections can't be shared between threads
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        storage_path = common.get_storage_path()
+        os.makedirs(storage_path, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(storage_path, DATABASE_FILE_NAME), timeout=30)
+        connection.row_factory = sqlite3.Row
+
+        # Write-ahead logging lets the page requests read while a sync is writing
+        connection.execute('PRAGMA journal_mode=WAL')
+        _local.connection = connection
+    return connection
+
+
+def ensure_schema(name: str, statements: list):
+    # Create the tables for a store the first time it's used in this process
+    if name in _created_schemas:
+        return
+    with _schema_lock:
+        if name not in _created_schemas:
+            connection = get_connection()
+            with connection:
+                for statement in statements:
+                    connection.execute(statement)
+            _created_schemas.add(name)
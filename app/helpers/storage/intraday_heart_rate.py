@@ -0,0 +1,165 @@
+import json
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import helpers.common as common
+import helpers.storage.database as database
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Heart rate is stored as whole beats per minute, zero means there's no sample for that second
+MISSING = 0
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS heart_rate_days (
+        owner TEXT NOT NULL,
+        day TEXT NOT NULL,
+        coverage TEXT NOT NULL,
+        complete INTEGER NOT NULL,
+        sync_generation TEXT NOT NULL,
+        PRIMARY KEY (owner, day)
+    )''',
+]
+
+
+def get_connection():
+    database.ensure_schema('intraday_heart_rate', SCHEMA)
+    return database.get_connection()
+
+
+def get_day_path(owner: str, day: date):
+    return os.path.join(common.get_storage_path(), 'heart_rate', owner, f'{day.isoformat()}.npy')
+
+
+def get_day_state(owner: str, day: date):
+    # Which seconds of a day have been fetched (a list of [start, end) ranges), whether the day is complete and the
+    # device sync the fetches were made after. None if nothing has been fetched for the day
+    row = get_connection().execute('SELECT coverage, complete, sync_generation FROM heart_rate_days WHERE owner = ? AND day = ?', [owner, day.isoformat()]).fetchone()
+    if row is None:
+        return None
+    return {'coverage': json.loads(row['coverage']), 'complete': bool(row['complete']), 'sync_generation': row['sync_generation']}
+
+
+def merge_ranges(ranges: list):
+    # Merge overlapping or touching [start, end) ranges
+    merged = list()
+    for start, end in sorted(ranges):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def get_generation_order(sync_generation: str):
+    # Sync generations are the device's last sync time (ISO 8601, so they sort as strings), 'none' comes before any sync
+    return '' if sync_generation is None or sync_generation == 'none' else sync_generation
+
+
+def get_missing(owner: str, day: date, start: int, end: int, sync_generation: str):
+    # The parts of [start, end) (seconds of the day) that need fetching. A complete day never does, what has been
+    # fetched for an incomplete day only counts until the device syncs again (fetches made after a later sync than the
+    # caller has seen count too)
+    state = get_day_state(owner, day)
+    if state is not None and state['complete']:
+        return []
+    current = state is not None and get_generation_order(state['sync_generation']) >= get_generation_order(sync_generation)
+    coverage = state['coverage'] if current else []
+
+    missing = list()
+    position = start
+    for covered_start, covered_end in coverage:
+        if covered_end <= position:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > position:
+            missing.append([position, covered_start])
+        position = max(position, covered_end)
+    if position < end:
+        missing.append([position, end])
+    return missing
+
+
+def is_complete(day: date, coverage: list, sync_generation: str):
+    # A day is complete once all of it has been fetched after the device synced data from after the end of the day.
+    # Without a sync time, days before yesterday are taken to be complete (the same as the API cache)
+    if coverage != [[0, SECONDS_PER_DAY]]:
+        return False
+    if sync_generation is None or sync_generation == 'none':
+        return day < date.today() - timedelta(days=1)
+    return sync_generation >= (day + timedelta(days=1)).isoformat()
+
+
+def save(owner: str, day: date, start: int, values: np.ndarray, sync_generation: str):
+    # Write the beats per minute for the seconds of a day from the start second (NaN where there's no sample). Nothing
+    # is written if the day already has data fetched after a later sync, so a worker that hasn't seen that sync yet
+    # can't overwrite it or reset its coverage
+    state = get_day_state(owner, day)
+    if state is not None and get_generation_order(state['sync_generation']) > get_generation_order(sync_generation):
+        return
+
+    path = get_day_path(owner, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        stored = np.lib.format.open_memmap(path, mode='r+')
+    else:
+        stored = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(SECONDS_PER_DAY,))
+    stored[start:start + len(values)] = np.clip(np.nan_to_num(values, nan=MISSING), 0, 255).astype(np.uint8)
+    stored.flush()
+    del stored
+
+    previous = state['coverage'] if state is not None and state['sync_generation'] == sync_generation else []
+    coverage = merge_ranges(previous + [[start, start + len(values)]])
+
+    connection = get_connection()
+    with connection:
+        # The row isn't replaced if another process saved data fetched after a later sync in the meantime
+        connection.execute(
+            '''INSERT INTO heart_rate_days (owner, day, coverage, complete, sync_generation) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (owner, day) DO UPDATE SET
+                coverage = excluded.coverage, complete = excluded.complete, sync_generation = excluded.sync_generation
+            WHERE (CASE sync_generation WHEN 'none' THEN '' ELSE sync_generation END) <= ?''',
+            [owner, day.isoformat(), json.dumps(coverage), int(is_complete(day, coverage, sync_generation)), sync_generation, get_generation_order(sync_generation)]
+        )
+
+
+def is_range_complete(owner: str, start: datetime, end: datetime):
+    # Whether every day a [start, end) range touches is complete (see is_complete), so its heart rate won't change
+    for day, _, _ in get_days(start, end):
+        state = get_day_state(owner, day)
+        if state is None or not state['complete']:
+            return False
+    return True
+
+
+def get_days(start: datetime, end: datetime):
+    # The days a [start, end) range touches, with the seconds of each day it covers
+    days = list()
+    day = start.date()
+    while datetime(day.year, day.month, day.day) < end:
+        day_start = datetime(day.year, day.month, day.day)
+        days.append((
+            day,
+            max(int((start - day_start).total_seconds()), 0),
+            min(int((end - day_start).total_seconds()), SECONDS_PER_DAY)
+        ))
+        day += timedelta(days=1)
+    return days
+
+
+def load_range(owner: str, start: datetime, end: datetime):
+    # The heart rate for every second in [start, end) as float32, NaN where there's no sample. Only the days in the
+    # range are read, each as a memory map
+    parts = list()
+    for day, day_start, day_end in get_days(start, end):
+        path = get_day_path(owner, day)
+        if os.path.exists(path):
+            part = np.load(path, mmap_mode='r')[day_start:day_end].astype(np.float32)
+            part[part == MISSING] = np.nan
+        else:
+            part = np.full(day_end - day_start, np.nan, dtype=np.float32)
+        parts.append(part)
+    return np.concatenate(parts) if len(parts) > 0 else np.array([], dtype=np.float32)
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import numpy as np
+
+import helpers.storage.database as database
+from helpers.constants import *
+
+# The period of the best curve across every activity (the other periods are seasons, named by year)
+PERIOD_ALL_TIME = 'all'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS power_curves (
+        activity_id INTEGER PRIMARY KEY,
+        athlete_id INTEGER NOT NULL,
+        start_date_local TEXT NOT NULL,
+        curve BLOB NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS power_curves_start_date ON power_curves (athlete_id, start_date_local)',
+    '''CREATE TABLE IF NOT EXISTS power_curve_bests (
+        athlete_id INTEGER NOT NULL,
+        period TEXT NOT NULL,
+        curve BLOB NOT NULL,
+        PRIMARY KEY (athlete_id, period)
+    )''',
+]
+
+
+def get_connection():
+    database.ensure_schema('power_curves', SCHEMA)
+    return database.get_connection()
+
+
+def encode(curve: np.ndarray):
+    return np.asarray(curve, dtype=np.float32).tobytes()
+
+
+def decode(blob: bytes):
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def get_season(start_date_local: datetime):
+    # Seasons are calendar years
+    return str(start_date_local.year)
+
+
+def save_curve(activity_id: int, athlete_id: int, start_date_local: datetime, curve: np.ndarray):
+    # Store the power curve of an activity (the power for every duration in the grid) and fold it into the all time and
+    # season bests. The bests are only updated the first time an activity is stored so they stay the element-wise
+    # maximum of the stored curves
+    connection = get_connection()
+    with connection:
+        inserted = connection.execute(
+            'INSERT OR IGNORE INTO power_curves (activity_id, athlete_id, start_date_local, curve) VALUES (?, ?, ?, ?)',
+            [activity_id, athlete_id, start_date_local.strftime(UTC_DATE_FORMAT), encode(curve)]
+        ).rowcount > 0
+        if not inserted:
+            return
+
+        for period in [PERIOD_ALL_TIME, get_season(start_date_local)]:
+            row = connection.execute('SELECT curve FROM power_curve_bests WHERE athlete_id = ? AND period = ?', [athlete_id, period]).fetchone()
+            best = curve if row is None else np.fmax(decode(row['curve']), curve)
+            connection.execute(
+                'INSERT OR REPLACE INTO power_curve_bests (athlete_id, period, curve) VALUES (?, ?, ?)',
+                [athlete_id, period, encode(best)]
+            )
+
+
+def get_curve(activity_id: int):
+    # The stored power curve of an activity, None if it hasn't been stored yet
+    row = get_connection().execute('SELECT curve FROM power_curves WHERE activity_id = ?', [activity_id]).fetchone()
+    return decode(row['curve']) if row is not None else None
+
+
+def get_curves(athlete_id: int, start: datetime = None, end: datetime = None):
+    # The stored power curves of an athlete's activities. Start and end are local times, the end is exclusive
+    query = 'SELECT curve FROM power_curves WHERE athlete_id = ?'
+    parameters = [athlete_id]
+    if start is not None:
+        query += ' AND start_date_local >= ?'
+        parameters.append(start.strftime(UTC_DATE_FORMAT))
+    if end is not None:
+        query += ' AND start_date_local < ?'
+        parameters.append(end.strftime(UTC_DATE_FORMAT))
+
+    return [decode(row['curve']) for row in get_connection().execute(query, parameters)]
+
+
+def get_best(athlete_id: int, period: str):
+    # The best curve for a period (all time or a season), None if there are no activities in it
+    row = get_connection().execute('SELECT curve FROM power_curve_bests WHERE athlete_id = ? AND period = ?', [athlete_id, period]).fetchone()
+    return decode(row['curve']) if row is not None else None
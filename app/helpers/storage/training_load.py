@@ -0,0 +1,107 @@
+import helpers.storage.database as database
+import helpers.storage.activity_index as activity_index
+
+# Where an activity's load came from: its stored stream or the summary from the activities list
+SOURCE_STREAM = 'stream'
+SOURCE_SUMMARY = 'summary'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS activity_loads (
+        activity_id INTEGER PRIMARY KEY,
+        athlete_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        load REAL NOT NULL,
+        source TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS activity_loads_day ON activity_loads (athlete_id, day)',
+    '''CREATE TABLE IF NOT EXISTS training_load (
+        athlete_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        load REAL NOT NULL,
+        fitness REAL NOT NULL,
+        fatigue REAL NOT NULL,
+        PRIMARY KEY (athlete_id, day)
+    )''',
+]
+
+
+def get_connection():
+    # The pending activities query joins the activity index so make sure its tables exist too
+    activity_index.get_connection()
+    database.ensure_schema('training_load', SCHEMA)
+    return database.get_connection()
+
+
+def get_pending_activities(athlete_id: int, types: list):
+    # Activities that have no load yet or only have one from their summary (their stream may have been stored since).
+    # Days are the local date the activity started on
+    return [
+        dict(row) for row in get_connection().execute(
+            f'''SELECT a.id, substr(a.start_date_local, 1, 10) AS day, a.summary, l.source
+                FROM activities a LEFT JOIN activity_loads l ON l.activity_id = a.id
+                WHERE a.athlete_id = ? AND a.type IN ({", ".join("?" * len(types))})
+                AND (l.source IS NULL OR l.source = ?)''',
+            [athlete_id, *types, SOURCE_SUMMARY]
+        )
+    ]
+
+
+def save_activity_loads(athlete_id: int, loads: list):
+    # Loads are (activity ID, day, load, source)
+    connection = get_connection()
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO activity_loads (activity_id, athlete_id, day, load, source) VALUES (?, ?, ?, ?, ?)',
+            [(activity_id, athlete_id, day, load, source) for activity_id, day, load, source in loads]
+        )
+
+
+def get_daily_loads(athlete_id: int, start_day: str):
+    # The total load of each day with activities, from the start day on
+    return [
+        (row['day'], row['load']) for row in get_connection().execute(
+            'SELECT day, SUM(load) AS load FROM activity_loads WHERE athlete_id = ? AND day >= ? GROUP BY day',
+            [athlete_id, start_day]
+        )
+    ]
+
+
+def get_first_activity_day(athlete_id: int):
+    row = get_connection().execute('SELECT MIN(day) AS day FROM activity_loads WHERE athlete_id = ?', [athlete_id]).fetchone()
+    return row['day']
+
+
+def get_last_day(athlete_id: int):
+    # The last day the fitness and fatigue have been worked out for, None if they never have
+    row = get_connection().execute('SELECT MAX(day) AS day FROM training_load WHERE athlete_id = ?', [athlete_id]).fetchone()
+    return row['day']
+
+
+def get_state_before(athlete_id: int, day: str):
+    # Fitness and fatigue at the end of the last day before the given one, zero before any training
+    row = get_connection().execute(
+        'SELECT fitness, fatigue FROM training_load WHERE athlete_id = ? AND day < ? ORDER BY day DESC LIMIT 1',
+        [athlete_id, day]
+    ).fetchone()
+    return (row['fitness'], row['fatigue']) if row is not None else (0.0, 0.0)
+
+
+def save_days(athlete_id: int, days: list):
+    # Days are (day, load, fitness, fatigue)
+    connection = get_connection()
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO training_load (athlete_id, day, load, fitness, fatigue) VALUES (?, ?, ?, ?, ?)',
+            [(athlete_id, day, load, fitness, fatigue) for day, load, fitness, fatigue in days]
+        )
+
+
+def get_days(athlete_id: int, start_day: str = None):
+    query = 'SELECT day, load, fitness, fatigue FROM training_load WHERE athlete_id = ?'
+    parameters = [athlete_id]
+    if start_day is not None:
+        query += ' AND day >= ?'
+        parameters.append(start_day)
+    query += ' ORDER BY day'
+
+    return [dict(row) for row in get_connection().execute(query, parameters)]
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import numpy as np
+
+import helpers.storage.database as database
+import helpers.storage.activity_index as activity_index
+from helpers.constants import *
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS zone_histograms (
+        activity_id INTEGER NOT NULL,
+        definition TEXT NOT NULL,
+        athlete_id INTEGER NOT NULL,
+        start_date_local TEXT NOT NULL,
+        seconds BLOB NOT NULL,
+        PRIMARY KEY (activity_id, definition)
+    )''',
+    'CREATE INDEX IF NOT EXISTS zone_histograms_start_date ON zone_histograms (athlete_id, definition, start_date_local)',
+]
+
+
+def get_connection():
+    # The missing histograms query joins the activity index so make sure its tables exist too
+    activity_index.get_connection()
+    database.ensure_schema('zone_histograms', SCHEMA)
+    return database.get_connection()
+
+
+def encode(seconds: np.ndarray):
+    return np.asarray(seconds, dtype=np.int32).tobytes()
+
+
+def decode(blob: bytes):
+    return np.frombuffer(blob, dtype=np.int32)
+
+
+def save_histograms(histograms: list):
+    # Histograms are (activity ID, definition, athlete ID, local start time, seconds in each zone)
+    connection = get_connection()
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO zone_histograms (activity_id, definition, athlete_id, start_date_local, seconds) VALUES (?, ?, ?, ?, ?)',
+            [
+                (activity_id, definition, athlete_id, start_date_local.strftime(UTC_DATE_FORMAT), encode(seconds))
+                for activity_id, definition, athlete_id, start_date_local, seconds in histograms
+            ]
+        )
+
+
+def get_histogram(activity_id: int, definition: str):
+    # The seconds in each zone for an activity, None if they haven't been worked out for these zones
+    row = get_connection().execute(
+        'SELECT seconds FROM zone_histograms WHERE activity_id = ? AND definition = ?',
+        [activity_id, definition]
+    ).fetchone()
+    return decode(row['seconds']) if row is not None else None
+
+
+def get_histograms(athlete_id: int, definition: str, start: datetime, end: datetime):
+    # The local start times and histograms of the athlete's activities in a range, the end is exclusive
+    rows = get_connection().execute(
+        'SELECT start_date_local, seconds FROM zone_histograms WHERE athlete_id = ? AND definition = ? AND start_date_local >= ? AND start_date_local < ?',
+        [athlete_id, definition, start.strftime(UTC_DATE_FORMAT), end.strftime(UTC_DATE_FORMAT)]
+    )
+    return [(datetime.strptime(row['start_date_local'], UTC_DATE_FORMAT), decode(row['seconds'])) for row in rows]
+
+
+def get_missing_activities(athlete_id: int, definition: str, start: datetime, end: datetime, types: list):
+    # Activities in a range that don't have a histogram for the zones yet, as (activity ID, local start time)
+    rows = get_connection().execute(
+        f'''SELECT a.id, a.start_date_local
+            FROM activities a LEFT JOIN zone_histograms z ON z.activity_id = a.id AND z.definition = ?
+            WHERE a.athlete_id = ? AND a.type IN ({", ".join("?" * len(types))})
+            AND a.start_date_local >= ? AND a.start_date_local < ? AND z.activity_id IS NULL''',
+        [definition, athlete_id, *types, start.strftime(UTC_DATE_FORMAT), end.strftime(UTC_DATE_FORMAT)]
+    )
+    return [(row['id'], datetime.strptime(row['start_date_local'], UTC_DATE_FORMAT)) for row in rows]
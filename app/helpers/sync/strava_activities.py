@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timedelta
+
+import helpers.api.backfill as backfill
+import helpers.api.rate_limit as rate_limit
+import helpers.api.single_flight as single_flight
+import helpers.api.strava as api_strava
+import helpers.common as common
+import helpers.storage.activity_index as activity_index
+
+# The most activities Strava will return in one page
+STRAVA_MAX_PAGE_SIZE = 200
+
+# How often (seconds) to check Strava for new activities, page views in between read the index only
+DEFAULT_MIN_SYNC_INTERVAL = 5 * 60
+
+# How far (days) before the newest activity we have each sync looks again, to catch activities uploaded late
+DEFAULT_SYNC_LOOKBACK_DAYS = 7
+
+
+def sync_activities(access_token: str, athlete_id: int, force: bool = False):
+    # Bring the local activity index up to date with Strava. Pages that need the index at the same time share one sync
+    single_flight.do(f'strava-activity-sync:{athlete_id}', lambda: sync_activities_now(access_token, athlete_id, force))
+
+
+def sync_activities_now(access_token: str, athlete_id: int, force: bool = False):
+    # Ask Strava for activities that started after the newest one we already have, less a lookback window. Activities
+    # are filtered by when they started rather than when they were uploaded, so the lookback picks up rides that were
+    # uploaded after a newer one (e.g. a device that synced late). Anything seen again replaces what we had, which also
+    # picks up recent edits (e.g. renames). The first sync only waits for the newest page, the rest of the athlete's
+    # history is backfilled in the background.
+    # Note: an activity uploaded more than the lookback after a newer one, or edited after that, isn't picked up
+    state = activity_index.get_sync_state(athlete_id)
+    min_interval = common.get_config_section('sync').get('strava_min_interval', DEFAULT_MIN_SYNC_INTERVAL)
+    if not force and state['last_sync'] is not None and state['last_sync'] > time.time() - min_interval:
+        return
+
+    newest = activity_index.get_newest_start(athlete_id)
+    if newest is not None:
+        lookback = common.get_config_section('sync').get('strava_lookback_days', DEFAULT_SYNC_LOOKBACK_DAYS)
+        fetch_pages(access_token, athlete_id, newest - timedelta(days=lookback))
+    elif state['backfilled']:
+        fetch_pages(access_token, athlete_id, None)
+    else:
+        activity_index.save_activities(athlete_id, api_strava.get_strava_activities(access_token, per_page=STRAVA_MAX_PAGE_SIZE))
+    activity_index.record_sync(athlete_id)
+
+    if not state['backfilled']:
+        backfill.start(f'strava-activity-backfill:{athlete_id}', lambda: backfill_activities(access_token, athlete_id))
+
+
+def fetch_pages(access_token: str, athlete_id: int, after: datetime):
+    page = 1
+    while True:
+        activities = api_strava.get_strava_activities(access_token, page=page, per_page=STRAVA_MAX_PAGE_SIZE, after=after)
+        activity_index.save_activities(athlete_id, activities)
+        if len(activities) < STRAVA_MAX_PAGE_SIZE:
+            break
+        page += 1
+
+
+def backfill_activities(access_token: str, athlete_id: int):
+    # Page back through the athlete's history from the oldest activity we have (in the background). Every page is saved
+    # as it arrives, and it stops as soon as the budget is down to the part kept for interactive requests, so the next
+    # sync carries on from where it got to
+    while rate_limit.has_background_budget(rate_limit.PROVIDER_STRAVA):
+        before = activity_index.get_oldest_start(athlete_id)
+        activities = api_strava.get_strava_activities(access_token, per_page=STRAVA_MAX_PAGE_SIZE, before=before)
+        activity_index.save_activities(athlete_id, activities)
+        if len(activities) < STRAVA_MAX_PAGE_SIZE:
+            activity_index.set_backfilled(athlete_id)
+            return
+
+
+def get_activities(access_token: str, athlete_id: int, start: datetime = None, end: datetime = None, types: list = None, limit: int = None):
+    # Get the athlete's activities from the local index, syncing any new ones from Strava first
+    sync_activities(access_token, athlete_id)
+    return activity_index.get_activities(athlete_id, start, end, types, limit)
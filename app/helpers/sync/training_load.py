@@ -0,0 +1,142 @@
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+import helpers.analytics.activity_stream as analytics_stream
+import helpers.analytics.power_summary as power_summary
+import helpers.analytics.training_load as training_load
+import helpers.api.single_flight as single_flight
+import helpers.api.strava as api_strava
+import helpers.common as common
+import helpers.storage.activity_streams as activity_streams
+import helpers.storage.training_load as training_load_store
+import helpers.sync.strava_activities as sync_strava
+from helpers.constants import *
+
+# The activity types that count towards the training load
+TRAINING_LOAD_TYPES = [STRAVA_ACTIVITY_RIDE, STRAVA_ACTIVITY_VIRTUAL_RIDE]
+
+# How many days the training load chart shows
+DEFAULT_CHART_DAYS = 365
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # Working out the normalised power of years of rides is CPU bound so it runs in other processes.
+    # The processes are spawned rather than forked because the pool is started from the fetch threads. Spawned processes
+    # run the app's start script again, which is why the app is started from server.py rather than app.py
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = common.get_config_section('training_load').get('max_workers', None)
+                _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def get_stream_load(activity_id):
+    # The load of a ride from its stored stream (runs in a worker process). None if the stream has no power
+    columns = activity_streams.load_stream(activity_id)
+    if columns is None:
+        return None
+
+    activity_stream = analytics_stream.from_columns(activity_id, columns)
+    if len(activity_stream) == 0 or not activity_stream.has_power():
+        return None
+    power_state = power_summary.get_power_state(activity_stream.power, activity_stream.time.max())
+    return training_load.get_load(power_state['normalised_power'], power_state['duration'])
+
+
+def get_summary_load(activity):
+    # The load of a ride from Strava's weighted average power, for rides whose stream hasn't been stored
+    return training_load.get_load(activity.get(STRAVA_API_KEY_AVERAGE_WEIGHTED_POWER, None), activity.get(STRAVA_API_KEY_MOVING_TIME, None))
+
+
+def update_activity_loads(athlete_id: int):
+    # Work out the load of every ride that doesn't have one yet (or only has one from its summary and now has a stream).
+    # Returns the earliest day that changed, None if nothing did
+    pending = training_load_store.get_pending_activities(athlete_id, TRAINING_LOAD_TYPES)
+    for activity in pending:
+        activity['has_stream'] = activity_streams.has_stream(activity['id'])
+    with_stream = [a for a in pending if a['has_stream']]
+    without_stream = [a for a in pending if a['source'] is None and not a['has_stream']]
+    if len(with_stream) == 0 and len(without_stream) == 0:
+        return None
+
+    stream_loads = get_executor().map(get_stream_load, [a['id'] for a in with_stream], chunksize=16) if len(with_stream) > 0 else []
+
+    loads = list()
+    for activity, load in zip(with_stream, stream_loads):
+        # Rides without a power meter still keep the stream as their source so they aren't looked at again
+        if load is None:
+            load = get_summary_load(json.loads(activity['summary']))
+        loads.append((activity['id'], activity['day'], load, training_load_store.SOURCE_STREAM))
+    for activity in without_stream:
+        loads.append((activity['id'], activity['day'], get_summary_load(json.loads(activity['summary'])), training_load_store.SOURCE_SUMMARY))
+
+    training_load_store.save_activity_loads(athlete_id, loads)
+    return min(day for _, day, _, _ in loads)
+
+
+def update_training_load(athlete_id: int, today: date = None):
+    # Bring the daily fitness and fatigue up to date. Only the days from the earliest new activity (or the last day
+    # worked out, if that's later) to today are recomputed, carrying on from the stored state the day before
+    today = today or date.today()
+    changed_day = update_activity_loads(athlete_id)
+    last_day = training_load_store.get_last_day(athlete_id)
+
+    if last_day is None:
+        start_day = training_load_store.get_first_activity_day(athlete_id)
+    else:
+        next_day = (date.fromisoformat(last_day) + timedelta(days=1)).isoformat()
+        start_day = min(changed_day, next_day) if changed_day is not None else next_day
+    if start_day is None or start_day > today.isoformat():
+        return
+
+    # Spread the loads of the days with activities over every day from the start to today
+    days = np.arange(np.datetime64(start_day), np.datetime64(today) + 1, dtype='datetime64[D]')
+    daily_loads = np.zeros(len(days))
+    activity_days = training_load_store.get_daily_loads(athlete_id, start_day)
+    if len(activity_days) > 0:
+        indices = (np.array([day for day, _ in activity_days], dtype='datetime64[D]') - days[0]).astype(np.int64)
+        in_range = indices < len(days)
+        np.add.at(daily_loads, indices[in_range], np.array([load for _, load in activity_days])[in_range])
+
+    initial_fitness, initial_fatigue = training_load_store.get_state_before(athlete_id, start_day)
+    fitness, fatigue = training_load.get_daily_state(daily_loads, initial_fitness, initial_fatigue)
+    training_load_store.save_days(athlete_id, zip(days.astype(str), daily_loads, fitness, fatigue))
+
+
+def get_training_load(access_token: str, athlete_id: int, days: int = None):
+    # Get the daily TSS, fitness (CTL), fatigue (ATL) and form (TSB) for the last few days (all of them if days is 0)
+    # using the athlete's FTP from Strava, syncing any new activities first. Returns a dictionary of columns, one element
+    # per day
+    if days is None:
+        days = common.get_config_section('training_load').get('chart_days', DEFAULT_CHART_DAYS)
+    ftp = api_strava.get_strava_athlete(access_token).get('ftp', None)
+    if not ftp:
+        raise ValueError('Set your FTP on Strava to see your training load')
+
+    sync_strava.sync_activities(access_token, athlete_id)
+    single_flight.do(f'training-load:{athlete_id}', lambda: update_training_load(athlete_id))
+
+    start_day = (date.today() - timedelta(days=days - 1)).isoformat() if days else None
+    rows = training_load_store.get_days(athlete_id, start_day)
+    previous = training_load_store.get_state_before(athlete_id, rows[0]['day']) if len(rows) > 0 else (0.0, 0.0)
+
+    fitness = training_load.to_tss([r['fitness'] for r in rows], ftp)
+    fatigue = training_load.to_tss([r['fatigue'] for r in rows], ftp)
+    previous_fitness, previous_fatigue = training_load.to_tss(previous, ftp)
+    return {
+        'day': np.array([r['day'] for r in rows], dtype='datetime64[D]'),
+        'tss': training_load.to_tss([r['load'] for r in rows], ftp),
+        'fitness': fitness,
+        'fatigue': fatigue,
+        'form': training_load.get_form(fitness, fatigue, previous_fitness, previous_fatigue),
+    }
@@ -0,0 +1,78 @@
+from datetime import date, datetime, timedelta
+from itertools import repeat
+
+import numpy as np
+
+import helpers.analytics.activity_stream as analytics_stream
+import helpers.analytics.zones as zones
+import helpers.api.single_flight as single_flight
+import helpers.api.strava as api_strava
+import helpers.common as common
+import helpers.storage.activity_streams as activity_streams
+import helpers.storage.zone_histograms as zone_histograms
+import helpers.sync.strava_activities as sync_strava
+import helpers.sync.training_load as sync_training_load
+
+# How many weeks the weekly zones chart shows
+DEFAULT_WEEKS = 12
+
+
+def get_stream_zone_seconds(activity_id, definitions: list):
+    # The seconds in each zone of a ride from its stored stream (runs in a worker process).
+    # Definitions are (kind, zones, threshold), returns a histogram for each of them
+    activity_stream = analytics_stream.from_columns(activity_id, activity_streams.load_stream(activity_id))
+    return [zones.get_activity_zone_seconds(activity_stream, kind, zone_list, threshold) for kind, zone_list, threshold in definitions]
+
+
+def fill_missing_histograms(athlete_id: int, definitions: list, start: datetime, end: datetime):
+    # Work out the histograms of every ride in the range with a stored stream that doesn't have them for these zones.
+    # Definitions are (definition, kind, zones, threshold). Rides without a stored stream are left out
+    missing = dict()
+    for definition, _, _, _ in definitions:
+        for activity_id, start_date_local in zone_histograms.get_missing_activities(athlete_id, definition, start, end, sync_training_load.TRAINING_LOAD_TYPES):
+            if activity_streams.has_stream(activity_id):
+                missing[activity_id] = start_date_local
+    if len(missing) == 0:
+        return
+
+    # Shares the training load's process pool, every set of zones comes from one pass over each stream
+    zone_definitions = [(kind, zone_list, threshold) for _, kind, zone_list, threshold in definitions]
+    results = sync_training_load.get_executor().map(get_stream_zone_seconds, missing.keys(), repeat(zone_definitions), chunksize=8)
+
+    histograms = list()
+    for (activity_id, start_date_local), activity_histograms in zip(missing.items(), results):
+        for (definition, _, _, _), seconds in zip(definitions, activity_histograms):
+            histograms.append((activity_id, definition, athlete_id, start_date_local, seconds))
+    zone_histograms.save_histograms(histograms)
+
+
+def get_weekly_zones(access_token: str, athlete_id: int, weeks: int = None):
+    # The time in each power and heart rate zone for each of the last few weeks (starting on Mondays), summed from the
+    # stored histograms of each ride. Returns the start of each week and, for each kind of zone, the zone names and a
+    # matrix of seconds (one row per week)
+    if weeks is None:
+        weeks = common.get_config_section('zones').get('weekly_weeks', DEFAULT_WEEKS)
+
+    definitions = zones.get_zone_definitions(api_strava.get_strava_athlete(access_token).get('ftp', None))
+    if len(definitions) == 0:
+        raise ValueError('Set your FTP on Strava or a heart rate in the config to see your zones')
+
+    sync_strava.sync_activities(access_token, athlete_id)
+
+    today = date.today()
+    first_week = today - timedelta(days=today.weekday() + 7 * (weeks - 1))
+    start = datetime(first_week.year, first_week.month, first_week.day)
+    end = datetime(today.year, today.month, today.day) + timedelta(days=1)
+
+    named = [(zones.get_definition(kind, zone_list, threshold), kind, zone_list, threshold) for kind, zone_list, threshold in definitions]
+    single_flight.do(f'zone-histograms:{athlete_id}', lambda: fill_missing_histograms(athlete_id, named, start, end))
+
+    output = {'week': np.datetime64(first_week) + np.arange(weeks) * 7}
+    for definition, kind, zone_list, _ in named:
+        weekly = np.zeros((weeks, len(zone_list)), dtype=np.int64)
+        histograms = zone_histograms.get_histograms(athlete_id, definition, start, end)
+        if len(histograms) > 0:
+            week_indices = (np.array([s for s, _ in histograms], dtype='datetime64[D]') - np.datetime64(first_week)).astype(np.int64) // 7
+            np.add.at(weekly, week_indices, np.stack([seconds for _, seconds in histograms]))
+        output[kind] = {'zones': [name for name, _ in zone_list], 'seconds': weekly}
+    return output
@@ -0,0 +1,55 @@
+import numpy as np
+
+import helpers.analytics.downsample as downsample
+import helpers.common as common
+
+# The most points sent to the browser for one line
+DEFAULT_MAX_POINTS = 2000
+
+
+def get_x_range(relayout_data):
+    # The visible x axis range after the user zooms a graph, None if the whole x axis is showing (autorange or reset).
+    # Returns False if the relayout didn't change the x axis (e.g. a y axis zoom or the graph being drawn)
+    if not relayout_data:
+        return False
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'])
+    if relayout_data.get('xaxis.autorange', False):
+        return None
+    return False
+
+
+def to_axis_value(value, x: np.ndarray):
+    # Plotly sends dates back as strings like '2020-01-01 10:00:00.5'
+    if np.issubdtype(x.dtype, np.datetime64):
+        return np.datetime64(str(value).strip().replace(' ', 'T')).astype(x.dtype)
+    return float(value)
+
+
+def downsample_line(x, y, x_range=None):
+    # Cut a line down to the visible range (plus a point either side so it runs to the edges) and to the configured
+    # number of points. Samples must be evenly spaced and in order of x
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    if x_range is not None and len(x) > 0:
+        start = max(np.searchsorted(x, to_axis_value(x_range[0], x), side='left') - 1, 0)
+        end = min(np.searchsorted(x, to_axis_value(x_range[1], x), side='right') + 1, len(x))
+        x, y = x[start:end], y[start:end]
+
+    chart_config = common.get_config_section('charts')
+    indices = downsample.get_indices(
+        y,
+        chart_config.get('max_points', DEFAULT_MAX_POINTS),
+        chart_config.get('downsample', downsample.METHOD_MIN_MAX)
+    )
+    return x[indices], y[indices]
+
+
+def get_x_axis(x_range, axis=None):
+    # Keep the zoom when a zoomed graph is redrawn at full resolution
+    axis = dict(axis or {})
+    if x_range is not None:
+        axis['range'] = list(x_range)
+    return axis
@@ -1,27 +1,36 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 import dash_core_components as dcc
 import pandas as pd
+import numpy as np
 import helpers.constants as constants
+import helpers.ui.charts as charts
+from helpers.analytics.activity_stream import ActivityStream
 from helpers.constants import *
 
 
-def get_detailed_heart_rate_graph(heart_rate_details):
-    dates = heart_rate_details.index
-    detailed_hr = heart_rate_details['hr']
+def get_detailed_heart_rate_figure(heart_rate_details, x_range=None):
+    dates, detailed_hr = charts.downsample_line(heart_rate_details.index.values, heart_rate_details['hr'].values, x_range)
+
+    return {
+        'data': [
+            {
+                'x': dates,
+                'y': detailed_hr,
+                'name': 'Resting heart rate',
+                'mode': 'line',
+                'line': {'color': constants.COLOUR_RED}
+            }
+        ],
+        'layout': {
+            'xaxis': charts.get_x_axis(x_range)
+        }
+    }
+
 
+def get_detailed_heart_rate_graph(heart_rate_details):
     return dcc.Graph(
         id='detailed-hr',
-        figure={
-            'data': [
-                {
-                    'x': dates,
-                    'y': detailed_hr,
-                    'name': 'Resting heart rate',
-                    'mode': 'line',
-                    'line': {'color': constants.COLOUR_RED}
-                }
-            ]
-        }
+        figure=get_detailed_heart_rate_figure(heart_rate_details)
     )
 
 
@@ -47,40 +56,49 @@ def get_resting_heart_rate_graph(heart_rate_history):
     )
 
 
-def get_heartrate_recovery(cycling_activity_stream, day_heartrate, activity_start: datetime):
-    day_dates = day_heartrate.index
-    day_hr = day_heartrate['hr']
+def get_heartrate_recovery_figure(activity_stream: ActivityStream, day_heartrate, activity_start: datetime, offset=None, x_range=None):
+    day_dates, day_hr = charts.downsample_line(day_heartrate.index.values, day_heartrate['hr'].values, x_range)
 
-    activity_dates = list(filter(lambda f: f[STRAVA_API_KEY_DATA_STREAM_TYPE] == STRAVA_API_KEY_DATA_STREAM_TIME, cycling_activity_stream))
-    activity_hr = list(filter(lambda f: f[STRAVA_API_KEY_DATA_STREAM_TYPE] == STRAVA_API_KEY_DATA_STREAM_HEARTRATE, cycling_activity_stream))
+    # Move the activity onto the Fitbit clock if the two have been lined up confidently
+    shift = offset['lag'] if offset is not None and offset['applied'] else 0
+    activity_dates = np.datetime64(activity_start, 's') + (activity_stream.time + shift).astype('timedelta64[s]')
+    activity_hr = np.where(activity_stream.heartrate > 0, activity_stream.heartrate, np.nan)
+    activity_dates, activity_hr = charts.downsample_line(activity_dates, activity_hr, x_range)
 
-    # Create an empty array of the right same length (we assume we always get time)
-    # This will be used if we're missing power and/or HR data
-    empty = [None] * len(activity_dates[0][STRAVA_API_KEY_DATA_STREAM_DATA])
+    return {
+        'data': [
+            {
+                'x': day_dates,
+                'y': day_hr,
+                'name': 'Fitbit heartrate',
+                'mode': 'line',
+                'line': {'color': constants.COLOUR_FITBIT_BLUE}
+            },
+            {
+                'x': activity_dates,
+                'y': activity_hr,
+                'name': 'Strava heartrate',
+                'mode': 'line',
+                'line': {'color': constants.COLOUR_STRAVA_ORANGE}
+            }
+        ],
+        'layout': {
+            'title': get_offset_description(offset),
+            'xaxis': charts.get_x_axis(x_range)
+        }
+    }
 
-    activity_dates = list(map(lambda t: (activity_start + timedelta(seconds=t)), activity_dates[0][STRAVA_API_KEY_DATA_STREAM_DATA]))
-    activity_hr = list(map(lambda h: h if h > 0 else None, activity_hr[0][STRAVA_API_KEY_DATA_STREAM_DATA])) if len(activity_hr) > 0 else empty
 
-    return dcc.Graph(
-        id='detailed-hr',
-        figure={
-            'data': [
-                {
-                    'x': day_dates,
-                    'y': day_hr,
-                    'name': 'Fitbit heartrate',
-                    'mode': 'line',
-                    'line': {'color': constants.COLOUR_FITBIT_BLUE}
-                },
-                {
-                    'x': activity_dates,
-                    'y': activity_hr,
-                    'name': 'Strava heartrate',
-                    'mode': 'line',
-                    'line': {'color': constants.COLOUR_STRAVA_ORANGE}
-                }
-            ]
-        }
-    )
+def get_offset_description(offset):
+    if offset is None:
+        return 'Strava heartrate not aligned (not enough heartrate in both)'
+    if offset['applied']:
+        return f'Strava heartrate moved {offset["lag"]:+d}s to match Fitbit (correlation {offset["confidence"]:.2f})'
+    return f'Strava heartrate not aligned (best match {offset["lag"]:+d}s only has correlation {offset["confidence"]:.2f})'
 
 
+def get_heartrate_recovery(activity_stream: ActivityStream, day_heartrate, activity_start: datetime, offset=None):
+    return dcc.Graph(
+        id='recovery-hr',
+        figure=get_heartrate_recovery_figure(activity_stream, day_heartrate, activity_start, offset)
+    )
@@ -1,6 +1,8 @@
 import dash_core_components as dcc
 from helpers.constants import *
 import dash_html_components as html
+import numpy as np
+from datetime import timedelta
 
 
 def get_cycling_average_power_table(power_averages, body_composition):
@@ -96,7 +98,16 @@ def get_cycling_power_summary_table(power_summary):
                             html.Th('TSS'),
                             html.Td(round(power_summary['tss'], 1)),
                         ]
-                    )
+                    ),
+                    *[
+                        html.Tr(
+                            [
+                                html.Th(f'Zone {index + 1}: {zone["name"]}'),
+                                html.Td(str(timedelta(seconds=zone['seconds']))),
+                            ]
+                        )
+                        for index, zone in enumerate(power_summary['zones'])
+                    ]
                 ]
             )
         ],
@@ -159,15 +170,18 @@ def get_cycling_power_splits_table(power_splits):
 
 def get_cycling_power_gradient_table(gradient_splits):
 
+    def power_cell(power):
+        return html.Td(EMPTY_PLACEHOLDER if np.isnan(power) else round(power))
+
     rows = list()
-    for index, row in gradient_splits.iterrows():
+    for gradient, duration, power_mean, power_max in zip(gradient_splits['gradient'], gradient_splits['duration'], gradient_splits['power_mean'], gradient_splits['power_max']):
         rows.append(
             html.Tr(
                 [
-                    html.Td(str(index)),
-                    html.Td(str(row['duration'].to_pytimedelta())),
-                    html.Td(round(row['power_mean'], 0) if isinstance(row['power_mean'], (int, float)) else EMPTY_PLACEHOLDER),
-                    html.Td(round(row['power_max'], 0) if isinstance(row['power_max'], (int, float)) else EMPTY_PLACEHOLDER)
+                    html.Td(f'{gradient:g}'),
+                    html.Td(str(timedelta(seconds=int(duration)))),
+                    power_cell(power_mean),
+                    power_cell(power_max)
                 ]
             )
         )
@@ -192,3 +206,51 @@ def get_cycling_power_gradient_table(gradient_splits):
     )
 
 
+def get_power_curve_trace(power_curve, name, colour):
+    # Only plot the durations the ride (or rides) were long enough for
+    has_power = ~np.isnan(power_curve['power'])
+    durations = power_curve['durations'][has_power]
+
+    return {
+        'x': durations,
+        'y': power_curve['power'][has_power],
+        'text': [str(timedelta(seconds=int(d))) for d in durations],
+        'hovertemplate': '%{text}: %{y:.0f}W',
+        'name': name,
+        'mode': 'line',
+        'line': {'color': colour}
+    }
+
+
+def get_power_curves_graph(traces, graph_id):
+    return dcc.Graph(
+        id=graph_id,
+        figure={
+            'data': traces,
+            'layout': {
+                'xaxis': {
+                    'title': 'Duration (seconds)',
+                    'type': 'log'
+                },
+                'yaxis': {
+                    'title': 'Power (Watts)'
+                }
+            }
+        }
+    )
+
+
+def get_power_curve_graph(power_curve, graph_id='power-curve'):
+    return get_power_curves_graph([get_power_curve_trace(power_curve, 'Power', COLOUR_BLUE)], graph_id)
+
+
+def get_best_power_curves_graph(best_power_curves, graph_id='best-power-curves'):
+    # The all time, season and rolling best curves on one graph
+    if len(best_power_curves) == 0:
+        return html.P('No rides with power have been analysed yet')
+
+    colours = [COLOUR_BLUE, COLOUR_STRAVA_ORANGE, COLOUR_PURPLE]
+    return get_power_curves_graph(
+        [get_power_curve_trace(curve, name, colour) for (name, curve), colour in zip(best_power_curves.items(), colours)],
+        graph_id
+    )
@@ -1,27 +1,15 @@
 import dash_core_components as dcc
 import helpers.constants as constants
 import dash_html_components as html
-from datetime import datetime, timedelta
-import plotly.figure_factory as ff
+from datetime import timedelta
 import dash_bootstrap_components as dbc
+import numpy as np
+import pandas as pd
+import helpers.analytics.sleep as sleep
 
 
-def get_sleep_history_graph(sleep_history):
-    dates = list(map(lambda x: x[constants.FITBIT_API_KEY_SLEEP_DATE], sleep_history[constants.FITBIT_API_KEY_SLEEP]))
-
-    deep = list(map(lambda x: x[constants.FITBIT_API_KEY_SLEEP_LEVELS][constants.FITBIT_API_KEY_SLEEP_SUMMARY].get(constants.FITBIT_API_KEY_SLEEP_DEEP, {constants.FITBIT_API_KEY_SLEEP_MINUTES: None})[constants.FITBIT_API_KEY_SLEEP_MINUTES], sleep_history[constants.FITBIT_API_KEY_SLEEP]))
-    light = list(
-        map(lambda x: x[constants.FITBIT_API_KEY_SLEEP_LEVELS][constants.FITBIT_API_KEY_SLEEP_SUMMARY].get(constants.FITBIT_API_KEY_SLEEP_LIGHT, {constants.FITBIT_API_KEY_SLEEP_MINUTES: None})[constants.FITBIT_API_KEY_SLEEP_MINUTES], sleep_history[constants.FITBIT_API_KEY_SLEEP]))
-    rem = list(map(lambda x: x[constants.FITBIT_API_KEY_SLEEP_LEVELS][constants.FITBIT_API_KEY_SLEEP_SUMMARY].get(constants.FITBIT_API_KEY_SLEEP_REM, {constants.FITBIT_API_KEY_SLEEP_MINUTES: None})[constants.FITBIT_API_KEY_SLEEP_MINUTES], sleep_history[constants.FITBIT_API_KEY_SLEEP]))
-    wake = list(map(lambda x: x[constants.FITBIT_API_KEY_SLEEP_LEVELS][constants.FITBIT_API_KEY_SLEEP_SUMMARY].get(constants.FITBIT_API_KEY_SLEEP_WAKE, {constants.FITBIT_API_KEY_SLEEP_MINUTES: None})[constants.FITBIT_API_KEY_SLEEP_MINUTES], sleep_history[constants.FITBIT_API_KEY_SLEEP]))
-
-    # Data from sleeps not long enough to be tracked with sleep stages
-    awake = list(
-        map(lambda x: x[constants.FITBIT_API_KEY_SLEEP_LEVELS][constants.FITBIT_API_KEY_SLEEP_SUMMARY].get(constants.FITBIT_API_KEY_SLEEP_AWAKE, {constants.FITBIT_API_KEY_SLEEP_MINUTES: None})[constants.FITBIT_API_KEY_SLEEP_MINUTES], sleep_history[constants.FITBIT_API_KEY_SLEEP]))
-    asleep = list(
-        map(lambda x: x[constants.FITBIT_API_KEY_SLEEP_LEVELS][constants.FITBIT_API_KEY_SLEEP_SUMMARY].get(constants.FITBIT_API_KEY_SLEEP_ASLEEP, {constants.FITBIT_API_KEY_SLEEP_MINUTES: None})[constants.FITBIT_API_KEY_SLEEP_MINUTES], sleep_history[constants.FITBIT_API_KEY_SLEEP]))
-    restless = list(
-        map(lambda x: x[constants.FITBIT_API_KEY_SLEEP_LEVELS][constants.FITBIT_API_KEY_SLEEP_SUMMARY].get(constants.FITBIT_API_KEY_SLEEP_RESTLESS, {constants.FITBIT_API_KEY_SLEEP_MINUTES: None})[constants.FITBIT_API_KEY_SLEEP_MINUTES], sleep_history[constants.FITBIT_API_KEY_SLEEP]))
+def get_sleep_history_graph(sleep_frame):
+    dates = sleep_frame['date'].values
 
     return dcc.Graph(
         id='sleep-history',
@@ -29,68 +17,66 @@ def get_sleep_history_graph(sleep_history):
             'data': [
                 {
                     'x': dates,
-                    'y': deep,
+                    'y': sleep_frame[constants.FITBIT_API_KEY_SLEEP_DEEP].values,
                     'name': 'Deep',
                     'type': 'bar'
                 },
                 {
                     'x': dates,
-                    'y': light,
+                    'y': sleep_frame[constants.FITBIT_API_KEY_SLEEP_LIGHT].values,
                     'name': 'Light',
                     'type': 'bar'
                 },
                 {
                     'x': dates,
-                    'y': rem,
+                    'y': sleep_frame[constants.FITBIT_API_KEY_SLEEP_REM].values,
                     'name': 'REM',
                     'type': 'bar',
                 },
                 {
                     'x': dates,
-                    'y': wake,
+                    'y': sleep_frame[constants.FITBIT_API_KEY_SLEEP_WAKE].values,
                     'name': 'Wake',
                     'type': 'bar'
                 },
+                # Data from sleeps not long enough to be tracked with sleep stages
                 {
                     'x': dates,
-                    'y': asleep,
+                    'y': sleep_frame[constants.FITBIT_API_KEY_SLEEP_ASLEEP].values,
                     'name': 'Asleep (short sleep)',
                     'type': 'bar'
                 },
                 {
                     'x': dates,
-                    'y': awake,
+                    'y': sleep_frame[constants.FITBIT_API_KEY_SLEEP_AWAKE].values,
                     'name': 'Awake (short sleep)',
                     'type': 'bar'
                 },
                 {
                     'x': dates,
-                    'y': restless,
+                    'y': sleep_frame[constants.FITBIT_API_KEY_SLEEP_RESTLESS].values,
                     'name': 'Restless (short sleep)',
                     'type': 'bar'
                 }
             ],
             'layout': {
                 'barmode': 'stack',
-                'title': '30 day sleep record',
+                'title': 'Sleep record',
                 'colorway': [constants.COLOUR_SLEEP_DEEP, constants.COLOUR_SLEEP_LIGHT, constants.COLOUR_SLEEP_REM, constants.COLOUR_SLEEP_WAKE, '#FF0000', '#00FF00', '#0000FF']
             }
         },
     )
 
 
-def get_sleep_efficiency_graph(sleep_history):
-    dates = list(map(lambda x: x['dateOfSleep'], sleep_history['sleep']))
-    resting_hr = list(map(lambda x: x['efficiency'], sleep_history['sleep']))
-
+def get_sleep_efficiency_graph(sleep_frame):
     return dcc.Graph(
         id='sleep-score',
         figure={
             'data': [
                 {
-                    'x': dates,
-                    'y': resting_hr,
-                    'name': 'Resting heart rate',
+                    'x': sleep_frame['date'].values,
+                    'y': sleep_frame['efficiency'].values,
+                    'name': 'Sleep efficiency',
                     'mode': 'line',
                     'line': {'color': constants.COLOUR_PURPLE}
                 }
@@ -99,12 +85,19 @@ def get_sleep_efficiency_graph(sleep_history):
     )
 
 
-def get_detailed_sleep_table(sleep_day):
-    total_duration = timedelta(milliseconds=sleep_day['duration'])
-    deep_duration = timedelta(minutes=sleep_day['levels']['summary'].get('deep', {'minutes': 0})['minutes'])
-    light_duration = timedelta(minutes=sleep_day['levels']['summary'].get('light', {'minutes': 0})['minutes'])
-    rem_duration = timedelta(minutes=sleep_day['levels']['summary'].get('rem', {'minutes': 0})['minutes'])
-    awake_duration = timedelta(minutes=sleep_day['levels']['summary'].get('wake', {'minutes': 0})['minutes'])
+def get_detailed_sleep_table(sleep_row):
+    # One row of the sleep frame
+    total_duration = timedelta(seconds=sleep_row['duration'])
+
+    def stage_row(name, stage):
+        minutes = 0 if np.isnan(sleep_row[stage]) else sleep_row[stage]
+        return html.Tr(
+            [
+                html.Td(name),
+                html.Td(str(timedelta(minutes=minutes))),
+                html.Td(round(timedelta(minutes=minutes) / total_duration * 100, 1)),
+            ]
+        )
 
     return html.Table(
         [
@@ -126,34 +119,10 @@ def get_detailed_sleep_table(sleep_day):
                             html.Td(constants.EMPTY_PLACEHOLDER),
                         ]
                     ),
-                    html.Tr(
-                        [
-                            html.Td('Awake'),
-                            html.Td(str(awake_duration)),
-                            html.Td(round(awake_duration / total_duration * 100, 1)),
-                        ]
-                    ),
-                    html.Tr(
-                        [
-                            html.Td('REM'),
-                            html.Td(str(rem_duration)),
-                            html.Td(round(rem_duration / total_duration * 100, 1)),
-                        ]
-                    ),
-                    html.Tr(
-                        [
-                            html.Td('Light'),
-                            html.Td(str(light_duration)),
-                            html.Td(round(light_duration / total_duration * 100, 1)),
-                        ]
-                    ),
-                    html.Tr(
-                        [
-                            html.Td('Deep'),
-                            html.Td(str(deep_duration)),
-                            html.Td(round(deep_duration / total_duration * 100, 1)),
-                        ]
-                    ),
+                    stage_row('Awake', constants.FITBIT_API_KEY_SLEEP_WAKE),
+                    stage_row('REM', constants.FITBIT_API_KEY_SLEEP_REM),
+                    stage_row('Light', constants.FITBIT_API_KEY_SLEEP_LIGHT),
+                    stage_row('Deep', constants.FITBIT_API_KEY_SLEEP_DEEP),
                 ]
             )
         ],
@@ -161,98 +130,124 @@ def get_detailed_sleep_table(sleep_day):
     )
 
 
-def get_detailed_sleep_graph(sleep_data):
-    graphs = list()
-    for sleep_day in sleep_data['sleep']:
-        sleep_periods = sleep_day['levels']['data']
-
-        gantt_chart_data = list(map(sleep_period_to_gantt_element, sleep_periods))
+# Hypnogram rows from the bottom up, with the stages of short (classic) sleeps next to the closest full stage
+HYPNOGRAM_LEVELS = [
+    (constants.FITBIT_API_KEY_SLEEP_DEEP, 'Deep', constants.COLOUR_SLEEP_DEEP),
+    (constants.FITBIT_API_KEY_SLEEP_ASLEEP, 'Asleep', constants.COLOUR_SLEEP_DEEP),
+    (constants.FITBIT_API_KEY_SLEEP_LIGHT, 'Light', constants.COLOUR_SLEEP_LIGHT),
+    (constants.FITBIT_API_KEY_SLEEP_RESTLESS, 'Restless', constants.COLOUR_SLEEP_LIGHT),
+    (constants.FITBIT_API_KEY_SLEEP_REM, 'REM', constants.COLOUR_SLEEP_REM),
+    (constants.FITBIT_API_KEY_SLEEP_WAKE, 'Awake', constants.COLOUR_SLEEP_WAKE),
+    (constants.FITBIT_API_KEY_SLEEP_AWAKE, 'Awake', constants.COLOUR_SLEEP_WAKE),
+]
+
+# Every night in the multi-night view is drawn on the same (arbitrary) day, from noon to noon
+NIGHT_VIEW_ORIGIN = np.datetime64('2000-01-01T12:00:00', 'ms')
+
+# The most nights the multi-night view shows at once (the most recent), older ones are scrolled to by panning
+NIGHT_VIEW_ROWS = 60
+NIGHT_VIEW_ROW_HEIGHT = 20
+
+
+def get_level_names(sleep_periods):
+    return sleep_periods['level'].map({level: name for level, name, _ in HYPNOGRAM_LEVELS}).values
+
+
+def get_period_traces(sleep_periods, y, base, hover_name=False):
+    # One horizontal bar trace per stage (not per period): the bars start at the base and are as long as the period,
+    # which is given in milliseconds as that's how a date axis measures length
+    names = get_level_names(sleep_periods)
+    colours = {name: colour for _, name, colour in HYPNOGRAM_LEVELS}
+
+    traces = list()
+    for name, colour in colours.items():
+        selected = names == name
+        if not selected.any():
+            continue
+
+        minutes = np.round(sleep_periods['seconds'].values[selected] / 60, 1)
+        traces.append({
+            'type': 'bar',
+            'orientation': 'h',
+            'name': name,
+            'y': y[selected],
+            'base': base[selected],
+            'x': sleep_periods['seconds'].values[selected] * 1000,
+            'customdata': minutes,
+            'hovertemplate': f'{name}: %{{customdata}} min<extra></extra>' if hover_name else '%{customdata} min',
+            'marker': {'color': colour},
+        })
+    return traces
+
+
+def get_hypnogram_figure(sleep_periods):
+    # The stage over time for any number of sleeps in one figure, one row per stage
+    return {
+        'data': get_period_traces(sleep_periods, get_level_names(sleep_periods), sleep_periods['start'].values),
+        'layout': {
+            'barmode': 'overlay',
+            'bargap': 0,
+            'showlegend': False,
+            'xaxis': {'type': 'date'},
+            'yaxis': {'type': 'category', 'categoryorder': 'array', 'categoryarray': list(dict.fromkeys(name for _, name, _ in HYPNOGRAM_LEVELS))},
+        }
+    }
+
+
+def get_sleep_nights_figure(sleep_periods):
+    # Every sleep in a row of its own (by date), from noon the day before to noon, coloured by stage. Naps during the
+    # day are drawn on the row of the night they're recorded with
+    noon_before = (sleep_periods['date'].values.astype('datetime64[D]') - np.timedelta64(1, 'D')).astype('datetime64[ms]') + np.timedelta64(12, 'h')
+    base = NIGHT_VIEW_ORIGIN + (sleep_periods['start'].values.astype('datetime64[ms]') - noon_before)
+    dates = np.datetime_as_string(sleep_periods['date'].values, unit='D')
+    nights = len(np.unique(dates))
+
+    return {
+        'data': get_period_traces(sleep_periods, dates, base, hover_name=True),
+        'layout': {
+            'barmode': 'overlay',
+            'bargap': 0.2,
+            'title': 'Sleep by night',
+            'xaxis': {
+                'type': 'date',
+                'tickformat': '%H:%M',
+                'range': [str(NIGHT_VIEW_ORIGIN), str(NIGHT_VIEW_ORIGIN + np.timedelta64(1, 'D'))],
+            },
+            'yaxis': {
+                'type': 'category',
+                'categoryorder': 'category ascending',
+                'range': [max(nights - NIGHT_VIEW_ROWS, 0) - 0.5, nights - 0.5],
+            },
+            'height': max(400, NIGHT_VIEW_ROW_HEIGHT * min(nights, NIGHT_VIEW_ROWS)),
+        }
+    }
 
-        gantt_chart_data = sorted(gantt_chart_data, key=lambda g: g['Level'], reverse=True)
 
-        colours = dict(Awake=constants.COLOUR_SLEEP_WAKE,
-                      REM=constants.COLOUR_SLEEP_REM,
-                      Deep=constants.COLOUR_SLEEP_DEEP,
-                      Light=constants.COLOUR_SLEEP_LIGHT,
-                      Restless=constants.COLOUR_SLEEP_LIGHT,
-                      Asleep=constants.COLOUR_SLEEP_DEEP)
+def get_sleep_nights_graph(sleep_periods):
+    return dcc.Graph(id='sleep-nights', figure=get_sleep_nights_figure(sleep_periods))
 
-        fig = ff.create_gantt(gantt_chart_data, group_tasks=True, index_col='Task', colors=colours, title=None, height=None)
 
-        row = dbc.Row(
+def get_detailed_sleep_graph(sleep_data):
+    # A hypnogram of every sleep in one figure with a summary of each sleep next to it, in time order
+    sleep_frame = sleep.get_sleep_frame(sleep_data).sort_values('start')
+    summaries = list()
+    for _, sleep_row in sleep_frame.iterrows():
+        summaries.append(html.H2(f'Summary {pd.Timestamp(sleep_row["start"]):%H:%M}' if len(sleep_frame) > 1 else 'Summary'))
+        summaries.append(get_detailed_sleep_table(sleep_row))
+
+    return [
+        dbc.Row(
             [
                 dbc.Col(
                     [
-                        dcc.Graph(figure=fig, id='gantt')
+                        dcc.Graph(figure=get_hypnogram_figure(sleep.get_sleep_periods(sleep_data)), id='hypnogram')
                     ],
                     md=9,
                 ),
                 dbc.Col(
-                    [
-                        html.H2('Summary'),
-                        get_detailed_sleep_table(sleep_day)
-                    ],
+                    summaries,
                     md=3,
                 )
             ]
         )
-
-        graphs.append(row)
-
-    # Reverse the list of graphs to get them in tme order
-    return graphs[::-1]
-
-
-
-
-
-def sleep_period_to_gantt_element(sleep_period):
-    start_time = datetime.strptime(sleep_period['dateTime'], constants.FITBIT_LOCAL_TIME)
-    end_time = start_time + timedelta(seconds=sleep_period['seconds'])
-    current_phase = sleep_period['level']
-
-    return dict(
-        Task=get_sleep_name(current_phase),
-        Start = start_time.strftime(constants.GANTT_CHART_TIME),
-        Finish=end_time.strftime(constants.GANTT_CHART_TIME),
-        Level=get_sleep_level(current_phase),
-        Description=f'Duration: {str(end_time - start_time)}'
-    )
-
-
-def get_sleep_name(sleep_phase):
-    if sleep_phase == 'wake':
-        return 'Awake'
-    elif sleep_phase == 'rem':
-        return 'REM'
-    elif sleep_phase == 'deep':
-        return 'Deep'
-    elif sleep_phase == 'light':
-        return 'Light'
-    elif sleep_phase == 'awake':
-        return 'Awake'
-    elif sleep_phase == 'restless':
-        return 'Restless'
-    elif sleep_phase == 'asleep':
-        return 'Asleep'
-    else:
-        return 'Unknown'
-
-
-def get_sleep_level(sleep_phase):
-    if sleep_phase == 'wake':
-        return 4
-    elif sleep_phase == 'rem':
-        return 3
-    elif sleep_phase == 'deep':
-        return 1
-    elif sleep_phase == 'light':
-        return 2
-    elif sleep_phase == 'awake':
-        return 3
-    elif sleep_phase == 'restless':
-        return 2
-    elif sleep_phase == 'asleep':
-        return 1
-    else:
-        return 999
+    ]
@@ -1,7 +1,10 @@
 import dash_core_components as dcc
 from helpers.constants import *
 import dash_html_components as html
+import numpy as np
 from datetime import datetime, timedelta
+from helpers.analytics.activity_stream import ActivityStream
+import helpers.ui.charts as charts
 
 
 def get_activity_history_graph(activity_history):
@@ -108,51 +111,48 @@ def cycling_activity_to_tr(cycling_activity):
     )
 
 
-def get_cycling_activity_graph(cycling_activity_stream):
+def get_cycling_activity_figure(activity_stream: ActivityStream, x_range=None):
 
-    time = list(filter(lambda f: f[STRAVA_API_KEY_DATA_STREAM_TYPE] == STRAVA_API_KEY_DATA_STREAM_TIME, cycling_activity_stream))
-    power = list(filter(lambda f: f[STRAVA_API_KEY_DATA_STREAM_TYPE] == STRAVA_API_KEY_DATA_STREAM_POWER, cycling_activity_stream))
-    hr = list(filter(lambda f: f[STRAVA_API_KEY_DATA_STREAM_TYPE] == STRAVA_API_KEY_DATA_STREAM_HEARTRATE, cycling_activity_stream))
+    time = activity_stream.time / 60
+    power_time, power = charts.downsample_line(time, activity_stream.power, x_range)
+    hr_time, hr = charts.downsample_line(time, np.where(activity_stream.heartrate > 0, activity_stream.heartrate, np.nan), x_range)
 
-    # Create an empty array of the right same length (we assume we always get time)
-    # This will be used if we're missing power and/or HR data
-    empty = [None] * len(time[0][STRAVA_API_KEY_DATA_STREAM_DATA])
+    return {
+        'data': [
+            {
+                'x': power_time,
+                'y': power,
+                'name': 'Power',
+                'mode': 'line',
+                'line': {'color': COLOUR_BLUE}
+            },
+            {
+                'x': hr_time,
+                'y': hr,
+                'name': 'Heart rate',
+                'mode': 'line',
+                'line': {'color': COLOUR_RED},
+                'yaxis': 'y2'
+            }
+        ],
+        'layout': {
+            'xaxis': charts.get_x_axis(x_range),
+            'yaxis':{
+                'title': 'Power'
+            },
+            'yaxis2':{
+                'title': 'Heart rate',
+                'overlaying': 'y',
+                'side': 'right'
+            }
+        }
+    }
 
-    time = list(map(lambda t: t / 60, time[0][STRAVA_API_KEY_DATA_STREAM_DATA]))
-    power = power[0][STRAVA_API_KEY_DATA_STREAM_DATA] if len(power) > 0 else empty
-    hr = list(map(lambda h: h if h > 0 else None, hr[0][STRAVA_API_KEY_DATA_STREAM_DATA])) if len(hr) > 0 else empty
 
+def get_cycling_activity_graph(activity_stream: ActivityStream):
     return dcc.Graph(
         id='cycling-power-hr',
-        figure={
-            'data': [
-                {
-                    'x': time,
-                    'y': power,
-                    'name': 'Power',
-                    'mode': 'line',
-                    'line': {'color': COLOUR_BLUE}
-                },
-                {
-                    'x': time,
-                    'y': hr,
-                    'name': 'Heart rate',
-                    'mode': 'line',
-                    'line': {'color': COLOUR_RED},
-                    'yaxis': 'y2'
-                }
-            ],
-            'layout': {
-                'yaxis':{
-                    'title': 'Power'
-                },
-                'yaxis2':{
-                    'title': 'Heart rate',
-                    'overlaying': 'y',
-                    'side': 'right'
-                }
-            }
-        }
+        figure=get_cycling_activity_figure(activity_stream)
     )
 
 
@@ -0,0 +1,53 @@
+import dash_core_components as dcc
+from helpers.constants import *
+
+
+def get_training_load_graph(training_load):
+    return dcc.Graph(
+        id='training-load',
+        figure={
+            'data': [
+                {
+                    'x': training_load['day'],
+                    'y': training_load['tss'],
+                    'name': 'TSS',
+                    'type': 'bar',
+                    'yaxis': 'y2',
+                    'marker': {'color': COLOUR_STRAVA_ORANGE},
+                    'opacity': 0.4
+                },
+                {
+                    'x': training_load['day'],
+                    'y': training_load['fitness'],
+                    'name': 'Fitness (CTL)',
+                    'mode': 'line',
+                    'line': {'color': COLOUR_BLUE}
+                },
+                {
+                    'x': training_load['day'],
+                    'y': training_load['fatigue'],
+                    'name': 'Fatigue (ATL)',
+                    'mode': 'line',
+                    'line': {'color': COLOUR_PURPLE}
+                },
+                {
+                    'x': training_load['day'],
+                    'y': training_load['form'],
+                    'name': 'Form (TSB)',
+                    'mode': 'line',
+                    'line': {'color': COLOUR_RED}
+                }
+            ],
+            'layout': {
+                'yaxis': {
+                    'title': 'Training load'
+                },
+                'yaxis2': {
+                    'title': 'TSS',
+                    'overlaying': 'y',
+                    'side': 'right',
+                    'showgrid': False
+                }
+            }
+        }
+    )
@@ -0,0 +1,87 @@
+import dash_core_components as dcc
+import dash_html_components as html
+from datetime import timedelta
+import helpers.analytics.zones as zones
+from helpers.constants import *
+
+TITLE_ZONES = {
+    zones.ZONES_POWER: 'Power zones',
+    zones.ZONES_HEART_RATE: 'Heart rate zones',
+}
+
+
+def get_zones_graph(kind, zone_seconds):
+    # Time in each zone for one ride
+    zone_names = [f'Zone {index + 1}: {name}' for index, name in enumerate(zone_seconds['zones'])]
+    minutes = zone_seconds['seconds'] / 60
+
+    return dcc.Graph(
+        id=f'zones-{kind}',
+        figure={
+            'data': [
+                {
+                    'x': minutes,
+                    'y': zone_names,
+                    'text': [str(timedelta(seconds=int(s))) for s in zone_seconds['seconds']],
+                    'hovertemplate': '%{y}: %{text}',
+                    'name': TITLE_ZONES[kind],
+                    'type': 'bar',
+                    'orientation': 'h',
+                    'marker': {'color': COLOUR_BLUE if kind == zones.ZONES_POWER else COLOUR_RED}
+                }
+            ],
+            'layout': {
+                'xaxis': {
+                    'title': 'Time (minutes)'
+                },
+                'yaxis': {
+                    'autorange': 'reversed'
+                }
+            }
+        }
+    )
+
+
+def get_cycling_zones(cycling_zones):
+    if len(cycling_zones) == 0:
+        return html.P('Set your FTP or a heart rate in the config to see your zones')
+
+    return html.Div(
+        [
+            html.Div([html.H3(TITLE_ZONES[kind]), get_zones_graph(kind, zone_seconds)])
+            for kind, zone_seconds in cycling_zones.items()
+        ]
+    )
+
+
+def get_weekly_zones_graph(kind, weeks, zone_seconds):
+    # Stacked hours in each zone for each week
+    return dcc.Graph(
+        id=f'weekly-zones-{kind}',
+        figure={
+            'data': [
+                {
+                    'x': weeks,
+                    'y': zone_seconds['seconds'][:, index] / 3600,
+                    'name': f'Zone {index + 1}: {name}',
+                    'type': 'bar'
+                }
+                for index, name in enumerate(zone_seconds['zones'])
+            ],
+            'layout': {
+                'barmode': 'stack',
+                'yaxis': {
+                    'title': 'Time (hours)'
+                }
+            }
+        }
+    )
+
+
+def get_weekly_zones(weekly_zones):
+    return html.Div(
+        [
+            html.Div([html.H4(TITLE_ZONES[kind]), get_weekly_zones_graph(kind, weekly_zones['week'], weekly_zones[kind])])
+            for kind in TITLE_ZONES.keys() if kind in weekly_zones
+        ]
+    )
@@ -0,0 +1,7 @@
+# Starts the app. Worker processes (e.g. the training load pool, which spawns them) run the script the app was started
+# from again before they do any work. Starting from this script rather than app.py means that only costs them this
+# file, not building the whole Dash app, loading the config and connecting the session store once per worker
+if __name__ == '__main__':
+    import app
+
+    app.run()
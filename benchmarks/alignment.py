@@ -0,0 +1,89 @@
+# Check the FFT heart rate alignment against trying every lag one by one with a plain Pearson correlation, and that the
+# offset it finds moves a recording the right way, then compare how long the two take.
+# Run from the repository root: python benchmarks/alignment.py
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import helpers.analytics.alignment as alignment
+
+REPEATS = 5
+
+
+def get_heart_rate(random, length):
+    # A heart rate that wanders like a real one (a smoothed random walk) with the occasional dropout
+    values = 120 + np.cumsum(random.normal(0, 1, length))
+    values = np.convolve(values, np.ones(15) / 15, mode='same')
+    values[random.random(length) < 0.05] = np.nan
+    return values
+
+
+def get_lag_brute_force(reference, signal, max_lag, min_overlap):
+    # The same answer as alignment.get_lag (the signal at second i lines up with the reference at i + lag), one lag at
+    # a time over the seconds where both have data
+    best = None
+    length = min(len(reference), len(signal))
+    for lag in range(-min(max_lag, length - 1), min(max_lag, length - 1) + 1):
+        if lag >= 0:
+            a, b = reference[lag:length], signal[:length - lag]
+        else:
+            a, b = reference[:length + lag], signal[-lag:length]
+        valid = ~np.isnan(a) & ~np.isnan(b)
+        if valid.sum() < max(min_overlap, 2) or np.std(a[valid]) == 0 or np.std(b[valid]) == 0:
+            continue
+        correlation = np.corrcoef(a[valid], b[valid])[0, 1]
+        if best is None or correlation > best['confidence']:
+            best = {'lag': lag, 'confidence': float(correlation), 'overlap': int(valid.sum())}
+    return best
+
+
+def check_brute_force(random):
+    # Random pairs with a known lag and noise. The noise can move the best lag a second or two from the true one, but
+    # both ways of working it out have to agree on it
+    for _ in range(20):
+        length = int(random.integers(900, 2400))
+        true_lag = int(random.integers(-120, 121))
+        base = get_heart_rate(random, length + 240)
+        reference = base[120:120 + length]
+        signal = base[120 + true_lag:120 + true_lag + length] + random.normal(0, 2, length)
+
+        fast = alignment.get_lag(reference, signal, 300, 300)
+        slow = get_lag_brute_force(reference, signal, 300, 300)
+        assert fast['lag'] == slow['lag'], (fast, slow)
+        assert abs(fast['lag'] - true_lag) <= 2, (fast, true_lag)
+        assert abs(fast['confidence'] - slow['confidence']) < 1e-6, (fast, slow)
+        assert fast['overlap'] == slow['overlap'], (fast, slow)
+
+
+def check_sign(random):
+    # A Fitbit day and a Strava ride whose clock is 45 seconds fast: the ride's second t happened at Fitbit second
+    # start + t - 45, so the ride's heart rate has to be moved -45 seconds to sit on the Fitbit heart rate (which is how
+    # helpers/ui/heartrate.py applies the lag)
+    day = get_heart_rate(random, 4 * 60 * 60)
+    start, length, clock_error = 60 * 60, 90 * 60, 45
+    seconds = np.arange(length)
+    ride = day[start + seconds - clock_error]
+
+    offset = alignment.get_offset(day, start, seconds, ride)
+    assert offset['lag'] == -clock_error, offset
+    shifted = start + seconds + offset['lag']
+    valid = ~np.isnan(ride)
+    assert np.array_equal(day[shifted][valid], ride[valid])
+
+
+if __name__ == '__main__':
+    random = np.random.default_rng(0)
+    check_brute_force(random)
+    check_sign(random)
+
+    reference = get_heart_rate(random, 3 * 60 * 60)
+    signal = np.roll(reference, 30)
+    print(f'{len(reference)} seconds, lags up to {alignment.DEFAULT_MAX_LAG}s either way, best of {REPEATS}')
+    slow_time = min(timeit.repeat(lambda: get_lag_brute_force(reference, signal, alignment.DEFAULT_MAX_LAG, alignment.DEFAULT_MIN_OVERLAP), number=1, repeat=REPEATS))
+    fast_time = min(timeit.repeat(lambda: alignment.get_lag(reference, signal), number=1, repeat=REPEATS))
+    print(f'one lag at a time: {slow_time * 1000:8.1f} ms')
+    print(f'FFT:               {fast_time * 1000:8.1f} ms ({slow_time / fast_time:.0f}x faster)')
@@ -0,0 +1,65 @@
+# Compare parsing a full day of one second Fitbit heart rate the old way (strptime for every sample then a reindex)
+# with the vectorised parsing the intraday heart rate store uses.
+# Run from the repository root: python benchmarks/intraday_heart_rate.py
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import helpers.analytics.intraday as intraday
+from helpers.constants import *
+
+DAY = datetime(2020, 6, 1)
+REPEATS = 5
+
+
+def get_fixture():
+    # A full day at one second detail with the occasional dropped sample, like a real watch
+    random = np.random.default_rng(0)
+    seconds = np.sort(random.choice(intraday.SECONDS_PER_DAY, size=int(intraday.SECONDS_PER_DAY * 0.9), replace=False))
+    values = random.integers(50, 180, size=len(seconds))
+    return [
+        {FITBIT_API_KEY_INTRADAY_TIME: f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}', FITBIT_API_KEY_INTRADAY_VALUE: int(v)}
+        for s, v in zip(seconds, values)
+    ]
+
+
+def parse_before(dataset):
+    day = datetime.strftime(DAY, '%Y-%m-%d')
+    df = pd.DataFrame(
+        {
+            'hr': list(map(lambda w: w[FITBIT_API_KEY_INTRADAY_VALUE], dataset))
+        },
+        index=list(map(lambda x: datetime.strptime(f'{day}T{x[FITBIT_API_KEY_INTRADAY_TIME]}Z', UTC_DATE_FORMAT), dataset))
+    )
+    start = datetime.strptime(f'{day}T00:00:00Z', UTC_DATE_FORMAT)
+    end = datetime.strptime(f'{day}T23:59:59Z', UTC_DATE_FORMAT)
+    new_index = pd.Index(np.arange(start, end + timedelta(seconds=1), timedelta(seconds=1)))
+    return df.reindex(new_index).interpolate(limit=20)
+
+
+def parse_after(dataset):
+    # What the app does: the samples are placed on the day's grid as they're stored, then short gaps are interpolated
+    # as they're read back
+    grid = intraday.place(intraday.get_seconds_of_day(dataset), intraday.get_values(dataset), 0, intraday.SECONDS_PER_DAY, 1)
+    return intraday.interpolate_gaps(grid)
+
+
+if __name__ == '__main__':
+    dataset = get_fixture()
+
+    before = parse_before(dataset)
+    after = parse_after(dataset)
+    assert len(before) == len(after)
+    assert np.allclose(before['hr'].to_numpy(dtype=np.float64), after, equal_nan=True)
+
+    print(f'{len(dataset)} samples, best of {REPEATS}')
+    before_time = min(timeit.repeat(lambda: parse_before(dataset), number=1, repeat=REPEATS))
+    after_time = min(timeit.repeat(lambda: parse_after(dataset), number=1, repeat=REPEATS))
+    print(f'before: {before_time * 1000:8.1f} ms')
+    print(f'after:  {after_time * 1000:8.1f} ms ({before_time / after_time:.0f}x faster)')